@@ -1,9 +1,16 @@
 from .path_utils import external_path
 from tkinter import filedialog, messagebox
 import os, sys
-import json
-import threading
+from datetime import datetime
 
+from .io_loop import IoLoop, TkBridge
+from .obs_writer import ObsWriter
+from .export_queue import ExportQueue
+from .session_catalog import SessionCatalog
+from .sqlite_store import SqliteStores
+from .profiler import SamplingProfiler
+from .map_view import read_track_points
+from .settings import load_settings, SettingsError, SettingsWatcher, RESTART_KEYS
 from .shapefile_gen import ShapefileGenerator
 from .gps_manager import GpsManager
 from .gui_manager import GuiManager
@@ -12,53 +19,106 @@ class InstaLogApp:
     def __init__(self):
         self.settings = self.load_settings()
         self.ask_save_folder()
+        self.profiler = self.start_profiler()
 
+        # One event loop owns serial I/O, track flushes and exports
+        self.io = IoLoop()
+        self.io.start()
+        self.bridge = TkBridge()
+        self.catalog = SessionCatalog(self.output_dir)
+        self.closing_job = None
+
+        # Optional SQLite backend, otherwise obs and track are written straight to CSV
+        self.stores = SqliteStores() if self.settings.get('storage') == 'sqlite' else None
+        store_for = self.stores.get if self.stores else None
+
+        # The GUI already batches saves, so snapshots are written as soon as they arrive
+        self.obs_writer = ObsWriter(self.io, debounce=0, on_write=self.obs_written, store_for=store_for)
         self.gps = GpsManager(self.settings.get('baud_rate'),
                               self.gps_callback,
-                              self.output_dir)
+                              self.output_dir,
+                              self.io,
+                              store_for,
+                              batch_size=5 if self.stores else 1)
         self.shapefile_gen = ShapefileGenerator(self.output_dir,
-                                                self.shapefile_gen_callback)
+                                                self.shapefile_gen_callback,
+                                                store_for=store_for)
+        self.export_queue = ExportQueue(self.io,
+                                        self.shapefile_gen.generate,
+                                        self.export_progress)
         self.gui = GuiManager(self.settings.get('shortcuts'),
                               self.gui_callback,
                               self.output_dir,
-                              self.init_port_thread)
+                              self.init_port_search,
+                              external_path(self.settings.get('tile_dir')))
 
         self.gui.protocol('WM_DELETE_WINDOW', self.on_close)
+        self.bridge.attach(self.gui)
+
+        # Settings changes are picked up without restarting or reconnecting the GPS
+        self.settings_watcher = SettingsWatcher(external_path('settings.json'),
+                                                self.reload_settings,
+                                                self.settings_error)
+        self.io.submit(self.settings_watcher.watch())
                                                                                               
     def run(self):
-        '''Run application'''
+        '''Run application and wait for background work once the GUI closes'''
         self.gui.run()
 
+        if self.closing_job:
+            self.closing_job.result()
+        self.io.stop()
+        self.catalog.close()
+        if self.stores:
+            self.stores.close()
+        if self.profiler:
+            self.profiler.stop()
+
     def load_settings(self):
         '''Reads in settings from a file'''
-        data = {}
-        filepath = external_path('settings.json')
         try:
-            with open(filepath) as file:
-                data = json.load(file)
-        except Exception as e:
-            messagebox.showerror('Error', f'Error opening settings file: {e}')
+            return load_settings(external_path('settings.json'))
+        except SettingsError as e:
+            messagebox.showerror('Error', str(e))
             sys.exit()
 
-        if not data.get('baud_rate'):
-            messagebox.showerror('Error', 'No baud_rate found in settings')
-            sys.exit()
-        elif not data.get('shortcuts'):
-            messagebox.showerror('Error', 'No shortcuts found in settings')
-            sys.exit()
-        else:
-            return data
+    def reload_settings(self, settings):
+        '''
+        - Swaps in settings reloaded while running
+        - Settings only read at startup keep their current values until restart
+        '''
+        for key in RESTART_KEYS:
+            settings.values[key] = self.settings.get(key)
+        self.settings = settings
+        self.bridge.post(self.gui.set_shortcuts, settings.shortcuts)
+
+    def settings_error(self, message):
+        '''Shows why a changed settings file was not reloaded'''
+        self.bridge.post(self.gui.show_settings_error, f'Settings not reloaded: {message}')
+
+    def start_profiler(self):
+        '''
+        - Starts CPU sampling and memory tracing if enabled by the "profile"
+        setting or the INSTALOG_PROFILE environment variable
+        - Reports are written to a folder in the output directory
+        '''
+        enabled = os.environ.get('INSTALOG_PROFILE', '').lower() in ('1', 'true', 'yes')
+        if not (enabled or self.settings.get('profile')):
+            return None
+
+        timestamp = datetime.now().strftime('%d%b%Y_%H%M%S')
+        profiler = SamplingProfiler(os.path.join(self.output_dir, f'instalog_profile_{timestamp}'))
+        profiler.start()
+        return profiler
 
-    def init_port_thread(self):
-        '''Initialize thread to find gps port in the background'''
-        # daemon=True ensures thread terminates when mainloop terminates
-        port_thread = threading.Thread(target=self.load, daemon=True)
-        port_thread.start()
+    def init_port_search(self):
+        '''Starts searching for the gps port on the io loop'''
+        self.io.submit(self.load())
 
-    def load(self):
+    async def load(self):
         '''Starts searching for gps and stops loading when finished'''
-        res = self.gps.find_gps_port()
-        self.gui.stop_loading(res)
+        res = await self.io.run_blocking(self.gps.find_gps_port)
+        self.bridge.post(self.gui.stop_loading, res)
 
     def ask_save_folder(self):
         '''Prompts the user to select a directory for output files'''
@@ -70,9 +130,71 @@ class InstaLogApp:
 
     def on_close(self):
         '''Destroys gui and generates shapefiles in background'''
+        self.gui.flush_save()
         self.gui.destroy()
-        closing_thread = threading.Thread(target=self.shapefile_gen.generate)
-        closing_thread.start()
+        self.closing_job = self.io.submit(self.close())
+
+    async def close(self):
+        '''Flushes remaining obs and track data and waits for all exports'''
+        await self.obs_writer.flush()
+        if self.gps.create_output:
+            self.gps.save()
+            self.record_track_rows()
+        else:
+            self.gps.discard_spool()
+        # Queued directly since this runs on the loop thread, so join() sees the job
+        job = self.shapefile_gen.make_job()
+        if job:
+            self.export_queue.put(job)
+        await self.export_queue.join()
+
+    def obs_written(self, path, headers, rows):
+        '''Records an obs csv's row count and time range in the catalog'''
+        time_index = list(headers).index('Time')
+        start_time = str(rows[0][time_index]) if rows else None
+        end_time = str(rows[-1][time_index]) if rows else None
+        self.catalog.update_obs(path, len(rows), start_time, end_time)
+
+    def record_track_rows(self):
+        '''Adds track rows written since the last call to the catalog'''
+        track_csv_path = self.io.run(self.gps.get_track_csv_path)
+        new_track_rows = self.io.run(self.gps.take_new_track_rows)
+        if track_csv_path:
+            self.catalog.add_track_rows(track_csv_path, new_track_rows)
+
+    def continue_map_track(self, data):
+        '''Clears the map track for a new session or fills it from a loaded session's track'''
+        if not data.get('status'):
+            self.gui.map_view.reset_track()
+        elif os.path.exists(data['track_path']):
+            self.gui.map_view.reset_track()
+            self.io.submit(self.load_map_track(data['track_path']))
+
+    async def load_map_track(self, track_csv_path):
+        '''Reads a track csv off the Tk thread and draws it on the map'''
+        points = await self.io.run_blocking(read_track_points, track_csv_path)
+        self.bridge.post(self.gui.map_view.add_fixes, points)
+
+    async def sync_session(self, session):
+        '''
+        - Brings a session's obs CSV up to date off the Tk thread, then has the
+        GUI open it
+        - Opening a session's store can import a whole track CSV, so it never
+        happens on the Tk thread
+        '''
+        try:
+            # Pending saves reach the obs CSV (or store) before it is read
+            await self.obs_writer.flush()
+            # Also creates the store of a session only logged in CSV mode so far
+            if self.stores:
+                store = await self.io.run_blocking(self.stores.get, session['obs_path'])
+                await self.io.run_blocking(store.export_obs_csv, session['obs_path'])
+        finally:
+            self.bridge.post(self.gui.open_session, session)
+
+    def export_progress(self, done, total, message):
+        '''Passes export progress to the GUI'''
+        self.bridge.post(self.gui.show_export_progress, done, total, message)
 
     def gui_callback(self, req, data=None):
         '''Callback function for GUI manager requests'''
@@ -81,29 +203,58 @@ class InstaLogApp:
         elif req == 'set create output':
             # Note we only need to tell gps because shapefile_gen will get a
             # value that is not "None" when requesting the obs csv path
-            self.gps.set_create_output(True)
+            self.io.run(self.gps.set_create_output, True)
         elif req == 'continue data':
             # Tell other managers whether we're continuing old project based on data['status']
-            self.gps.continue_data(data)
+            self.io.run(self.gps.continue_data, data)
             self.shapefile_gen.continue_data(data)
+            # Effort totals of earlier runs are only kept in the session's exported summary
+            if data.get('status'):
+                summary = self.shapefile_gen.read_summary(data['track_export_path'])
+                if summary:
+                    self.io.run(self.gps.restore_effort_summary, summary)
+            self.continue_map_track(data)
+        elif req == 'new session':
+            # Names every file of the new session at once
+            session = self.catalog.allocate()
+            self.gui_callback('continue data', dict(session, status=True))
+            return session
+        elif req == 'list sessions':
+            return self.catalog.list_sessions()
+        elif req == 'find session':
+            return self.catalog.find_by_obs_path(data['path'])
+        elif req == 'sync session':
+            self.io.submit(self.sync_session(data))
+        elif req == 'write obs':
+            self.obs_writer.request(data['path'], data['headers'], data['rows'])
         elif req == 'save work before new':
-            self.gps.save()
-            self.shapefile_gen.generate()
+            # Exports a snapshot of the finished session in the background
+            self.obs_writer.flush_now()
+            self.io.run(self.gps.save)
+            self.record_track_rows()
+            self.export_queue.submit(self.shapefile_gen.make_job())
+        elif req == 'cancel export':
+            self.export_queue.cancel()
         elif req == 'set coords':
-            self.gps.set_coords(data['coords'])
+            self.io.run(self.gps.set_coords, data['coords'])
         elif req == 'get time':
             return self.gps.get_time()
         else:
             return None
     
-    def gps_callback(self, req):
+    def gps_callback(self, req, data=None):
         '''Callback function for GPS manager requests'''
+        # GUI changes are passed to the Tk thread through the bridge
         if req == 'clear errors':
-            self.gui.clear_errors()
+            self.bridge.post(self.gui.clear_errors)
         elif req == 'has read error':
             return self.gui.has_read_error()
         elif req == 'show read error':
-            self.gui.show_error('Can\'t read from GPS')
+            self.bridge.post(self.gui.show_error, 'Can\'t read from GPS')
+        elif req == 'update stats':
+            self.bridge.post(self.gui.show_stats, data)
+        elif req == 'new fix':
+            self.bridge.post(self.gui.map_view.add_fix, *data)
         else:
             return None
         
@@ -113,5 +264,7 @@ class InstaLogApp:
             return self.gui.get_obs_csv_path()
         elif req == 'get track csv path':
             return self.gps.get_track_csv_path()
+        elif req == 'get effort summary':
+            return self.io.run(self.gps.get_effort_summary)
         else:
             return None
\ No newline at end of file
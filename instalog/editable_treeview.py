@@ -2,9 +2,10 @@ import tkinter as tk
 from tkinter import ttk
 
 class EditableTreeview(ttk.Treeview):
-    def __init__(self, master, save_func, **kwargs):
+    def __init__(self, master, save_func, edit_func, **kwargs):
         super().__init__(master, **kwargs)
         self.save = save_func
+        self.edit = edit_func
 
         self.entry = ttk.Entry(self)
         self.num_observers = 2
@@ -64,9 +65,11 @@ class EditableTreeview(ttk.Treeview):
         selected_iid = self.entry.selected_iid
         col_index = self.entry.col_index
 
-        new_values = self.item(selected_iid).get('values')
+        old_values = self.item(selected_iid).get('values')
+        new_values = list(old_values)
         new_values[col_index] = new_text
         self.item(selected_iid, values=new_values) # Updating row with new values
+        self.edit(old_values, new_values)
 
         # If num of observers changed, updates num of observers for all rows below
         if col_index == 3:
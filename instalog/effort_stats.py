@@ -0,0 +1,106 @@
+from datetime import datetime, timezone
+from .geo_utils import haversine
+from .gps_clock import format_time
+
+MPS_TO_KNOTS = 1.943844
+
+class EffortStats:
+    '''
+    - Running effort totals updated in O(1) for every GPS fix
+    - Distance and time only accumulate while on effort and across gaps of
+    at most max_gap seconds, so pauses in reading don't count as flown
+    '''
+    def __init__(self, max_gap=60):
+        self.max_gap = max_gap
+        self.reset()
+
+    def reset(self):
+        '''Clears all totals'''
+        self.num_fixes = 0
+        self.dropped_fixes = 0
+        self.distance_m = 0.0
+        self.effort_s = 0.0
+        self.speed_mps = 0.0
+        self.start_time = None
+        self.end_time = None
+        self.last_fix = None # (timestamp, lat, lon)
+
+    def restore(self, summary):
+        '''
+        - Continues from the totals of an earlier summary() (e.g. read back from
+        an exported summary csv) so a resumed session's totals cover all of it
+        - The gap since the summary's last fix is never counted as effort
+        - Raises ValueError if the summary can't be read
+        '''
+        self.reset()
+        self.num_fixes = int(summary.get('Fixes') or 0)
+        self.dropped_fixes = int(summary.get('DroppedFixes') or 0)
+        self.distance_m = float(summary.get('DistanceKm') or 0) * 1000
+        self.effort_s = self.parse_duration(summary.get('TimeOnEffort') or '0:00:00')
+        self.start_time = self.parse_timestamp(summary.get('StartTime'))
+        self.end_time = self.parse_timestamp(summary.get('EndTime'))
+
+    def add_fix(self, timestamp, lat, lon, on_effort):
+        '''Updates totals with a valid fix taken at timestamp (GPS epoch seconds)'''
+        if self.last_fix:
+            last_timestamp, last_lat, last_lon = self.last_fix
+            dt = timestamp - last_timestamp
+            if 0 < dt <= self.max_gap:
+                dist = haversine(last_lat, last_lon, lat, lon)
+                self.speed_mps = dist / dt
+                if on_effort:
+                    self.distance_m += dist
+                    self.effort_s += dt
+
+        if on_effort:
+            self.num_fixes += 1
+            if self.start_time is None:
+                self.start_time = timestamp
+            self.end_time = timestamp
+
+        self.last_fix = (timestamp, lat, lon)
+
+    def add_dropped(self):
+        '''Counts a fix that could not be read'''
+        self.dropped_fixes += 1
+
+    def summary(self) -> dict:
+        '''Returns the current totals as session summary attributes'''
+        avg_speed = self.distance_m / self.effort_s if self.effort_s else 0.0
+        return {
+            'Fixes': self.num_fixes,
+            'DroppedFixes': self.dropped_fixes,
+            'DistanceKm': round(self.distance_m / 1000, 3),
+            'TimeOnEffort': self.format_duration(self.effort_s),
+            'SpeedKn': round(self.speed_mps * MPS_TO_KNOTS, 1),
+            'AvgSpeedKn': round(avg_speed * MPS_TO_KNOTS, 1),
+            'StartTime': self.format_timestamp(self.start_time),
+            'EndTime': self.format_timestamp(self.end_time)
+        }
+
+    def format_duration(self, seconds):
+        '''Formats seconds as H:MM:SS'''
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        return f'{hours}:{minutes:02}:{seconds:02}'
+
+    def parse_duration(self, text):
+        '''Parses H:MM:SS back to seconds'''
+        hours, minutes, seconds = (int(part) for part in str(text).split(':'))
+        return hours * 3600 + minutes * 60 + seconds
+
+    def parse_timestamp(self, text):
+        '''Parses a formatted timestamp back to seconds, or None if unset'''
+        if not text:
+            return None
+        parsed = datetime.fromisoformat(str(text))
+        # Summaries written before times came from the GPS have no time zone
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+    def format_timestamp(self, timestamp):
+        '''Formats a timestamp (seconds) as UTC time or empty string if unset'''
+        if timestamp is None:
+            return ''
+        return format_time(datetime.fromtimestamp(timestamp, timezone.utc))
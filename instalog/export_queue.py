@@ -0,0 +1,54 @@
+import asyncio
+import threading
+from .shapefile_gen import ExportCancelled
+
+class ExportQueue:
+    '''Runs export jobs one after another on the io loop's executor'''
+    def __init__(self, io, generate, progress):
+        self.io = io
+        self.generate = generate
+        self.progress = progress
+
+        # Created on the loop thread when the first job arrives
+        self.jobs = None
+        self.worker = None
+        self.cancel_event = None
+
+    def submit(self, job):
+        '''Queues a job from any thread'''
+        if job:
+            self.io.call(self.put, job)
+
+    def put(self, job):
+        '''Queues a job and starts the worker if needed (loop thread)'''
+        if not self.jobs:
+            self.jobs = asyncio.Queue()
+            self.worker = asyncio.ensure_future(self.work())
+        self.jobs.put_nowait(job)
+        self.progress(0, 1, f'{job.name()}: queued')
+
+    async def work(self):
+        '''Takes jobs off the queue and exports them in order'''
+        while True:
+            job = await self.jobs.get()
+            self.cancel_event = threading.Event()
+            try:
+                await self.io.run_blocking(self.generate, job, self.progress, self.cancel_event)
+            except ExportCancelled:
+                self.progress(0, 1, f'{job.name()}: cancelled')
+            except Exception as e:
+                self.progress(0, 1, f'{job.name()}: failed ({e})')
+            finally:
+                self.cancel_event = None
+                self.jobs.task_done()
+
+    def cancel(self):
+        '''Cancels the running job at its next step'''
+        cancel_event = self.cancel_event
+        if cancel_event:
+            cancel_event.set()
+
+    async def join(self):
+        '''Waits until every queued job has finished'''
+        if self.jobs:
+            await self.jobs.join()
@@ -0,0 +1,16 @@
+import math
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+
+def haversine_np(lat1, lon1, lat2, lon2):
+    '''Returns great-circle distances in metres between arrays of coordinates'''
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+def haversine(lat1, lon1, lat2, lon2):
+    '''Returns great-circle distance in metres between two coordinates'''
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
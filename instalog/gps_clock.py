@@ -0,0 +1,98 @@
+from datetime import datetime, date, timedelta, timezone
+import time
+import re
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+def format_time(dt) -> str:
+    '''Formats a GPS datetime as "YYYY-MM-DD HH:MM:SS.mmm" (UTC)'''
+    return dt.strftime(TIME_FORMAT)[:-3]
+
+def parse_time(hhmmss) -> timedelta:
+    '''
+    - Parses an NMEA UTC time (e.g. "123519.00") into a time of day
+    - Raises ValueError if the field is malformed or out of range
+    '''
+    if not re.fullmatch(r'[0-9]{6}(\.[0-9]+)?', hhmmss):
+        raise ValueError(f'Invalid NMEA time: {hhmmss!r}')
+    hours, minutes, seconds = int(hhmmss[0:2]), int(hhmmss[2:4]), float(hhmmss[4:])
+    if hours > 23 or minutes > 59 or seconds >= 61: # 60 is a leap second
+        raise ValueError(f'Invalid NMEA time: {hhmmss!r}')
+    return timedelta(hours=hours, minutes=minutes, seconds=seconds)
+
+def parse_date(ddmmyy) -> date:
+    '''
+    - Parses an RMC date (e.g. "230394") into a date
+    - Raises ValueError if the field is malformed or not a real date
+    '''
+    if not re.fullmatch(r'[0-9]{6}', ddmmyy):
+        raise ValueError(f'Invalid NMEA date: {ddmmyy!r}')
+    return date(2000 + int(ddmmyy[4:6]), int(ddmmyy[2:4]), int(ddmmyy[0:2]))
+
+class GpsClock:
+    '''
+    - Turns NMEA UTC times of day (and RMC dates) into full datetimes
+    - Continuously estimates the offset between the system clock and GPS time,
+    and how fast that offset drifts, with an alpha-beta filter
+    - Maps any system time (e.g. a keypress) to GPS time
+    '''
+    def __init__(self, alpha=0.1, beta=0.005, max_error=5.0):
+        self.alpha = alpha # Share of each offset error applied to the offset
+        self.beta = beta # Share of each offset error applied to the drift
+        self.max_error = max_error # Errors above this many seconds are clock jumps
+
+        # (system time of last sample, offset in seconds, drift in seconds per second)
+        # Replaced as one tuple so other threads always read a consistent model
+        self.model = None
+
+    def to_datetime(self, time_of_day, received_at, day=None) -> datetime:
+        '''
+        - Returns the UTC datetime of a fix's time of day, received at the given
+        system time
+        - A date from the same sentence (RMC) is used as is
+        - Otherwise (GGA, GLL) the day is the one that puts the fix closest to
+        the current estimate of GPS time, so midnight is crossed correctly
+        '''
+        if day:
+            return datetime.combine(day, datetime.min.time(), timezone.utc) + time_of_day
+
+        estimate = self.now(received_at)
+        candidates = [datetime.combine(estimate.date() + timedelta(days=shift), datetime.min.time(), timezone.utc) + time_of_day
+                      for shift in (-1, 0, 1)]
+        return min(candidates, key=lambda candidate: abs((candidate - estimate).total_seconds()))
+
+    def update(self, gps_time, received_at):
+        '''Updates the offset and drift estimates with a GPS time received at received_at'''
+        sample = gps_time.timestamp() - received_at
+        if not self.model:
+            self.model = (received_at, sample, 0.0)
+            return
+
+        last_received_at, offset, drift = self.model
+        dt = received_at - last_received_at
+        predicted = offset + drift * dt
+        error = sample - predicted
+
+        # Restart the estimate after a clock jump instead of slowly chasing it. This
+        # also corrects a wrong day guessed from a bad system clock at the next RMC date
+        if abs(error) > self.max_error or dt <= 0:
+            self.model = (received_at, sample, 0.0)
+            return
+
+        self.model = (received_at, predicted + self.alpha * error, drift + self.beta * error / dt)
+
+    def now(self, system_time=None) -> datetime:
+        '''Returns the GPS time at system_time (default now), or system UTC if never synced'''
+        system_time = time.time() if system_time is None else system_time
+        model = self.model
+        if model:
+            last_received_at, offset, drift = model
+            system_time += offset + drift * (system_time - last_received_at)
+        return datetime.fromtimestamp(system_time, timezone.utc)
+
+    def status(self) -> dict:
+        '''Returns the current offset (ms) and drift (ppm) estimates'''
+        if not self.model:
+            return {'OffsetMs': None, 'DriftPpm': None}
+        _, offset, drift = self.model
+        return {'OffsetMs': round(offset * 1000, 1), 'DriftPpm': round(drift * 1e6, 2)}
@@ -1,29 +1,40 @@
 import serial
 import serial.tools.list_ports
-import threading
+import asyncio
 import time
-from datetime import datetime
-import pandas as pd
+import traceback
 import csv
 import os
-from .path_utils import new_path
+from .effort_stats import EffortStats
+from .track_spool import TrackSpool
+from .gps_clock import GpsClock, format_time, parse_time, parse_date
 
 class GpsManager:
-    def __init__(self, baud_rate, callback, output_dir):
+    '''
+    - Session state (coords, time, track spool, output paths) is owned by the
+    io loop thread
+    - Other threads must change it through io.run() and may only read it
+    '''
+    def __init__(self, baud_rate, callback, output_dir, io, store_for=None, batch_size=1):
         self.baud_rate = baud_rate
         self.callback = callback
         self.output_dir = output_dir
+        self.io = io
+        self.store_for = store_for # Returns the SQLite store for a csv path when that backend is used
+        self.batch_size = batch_size # Number of fixes written at once while creating output
         self.create_output = False
 
         self.coords = (0.0, 0.0)
         self.time = None
-        self.temp_track_df = pd.DataFrame(columns=['Time', 'Latitude', 'Longitude'])
+        self.clock = GpsClock()
+        self.track_spool = TrackSpool(output_dir)
         self.csv_path = None
-        self.date = None
-        self.counter = None
+        self.new_track_rows = 0
+        self.effort_stats = EffortStats()
     
     def get_time(self):
-        return self.time
+        '''Returns the current GPS time, estimated from the system clock between fixes'''
+        return format_time(self.clock.now())
 
     def get_track_csv_path(self):
         '''Returns track csv path'''
@@ -33,40 +44,52 @@ class GpsManager:
         '''Returns last recorded coordinates'''
         return self.coords
     
+    def get_effort_summary(self):
+        '''Returns the current effort statistics and clock estimates'''
+        return {**self.effort_stats.summary(), **self.clock.status()}
+
     def set_coords(self, coords):
         '''Sets self.coords to given value'''
         self.coords = coords
     
+    def take_new_track_rows(self):
+        '''Returns number of track rows written since the last call'''
+        new_track_rows, self.new_track_rows = self.new_track_rows, 0
+        return new_track_rows
+
     def set_create_output(self, create_output):
         '''
-        - Writes headers to csv if creating output for first time and new csv
+        - Writes headers to csv if creating output for a new track csv
         - Sets self.create_output to given value
+        - Promotes spooled track rows into the track csv once output is created
         '''
-        if (not self.create_output and create_output) and not self.csv_path:
-            date = datetime.today().strftime('%d%b%Y')
-            csv_name = f'{date}_track'
-            self.csv_path = os.path.join(self.output_dir, csv_name + '.csv')
-            if os.path.exists(self.csv_path):
-                self.csv_path = new_path(self.csv_path)
-
+        if create_output and self.csv_path and not os.path.exists(self.csv_path):
             headers = ['Time', 'Latitude', 'Longitude']
             with open(self.csv_path, mode='w', newline='') as file:
                 writer = csv.writer(file)
                 writer.writerow(headers)
 
         self.create_output = create_output
+        if self.create_output and self.csv_path:
+            self.save()
+
+    def restore_effort_summary(self, summary):
+        '''Continues the effort statistics of a loaded session from its last exported summary'''
+        try:
+            self.effort_stats.restore(summary)
+        except (ValueError, TypeError):
+            self.effort_stats.reset() # Unreadable summaries start the totals over
+        self.callback('update stats', self.get_effort_summary())
 
     def continue_data(self, data):
-        '''Updates attributes depending on whether old data may be added on to'''
+        '''Updates attributes depending on whether a session (new or loaded) is active'''
+        # Loaded sessions get their earlier totals back through restore_effort_summary
+        self.effort_stats.reset()
         if not data.get('status'):
             self.csv_path = None
             self.create_output = False
         else:
-            date = data['date']
-            counter = data['counter']
-            csv_name = f'{date}_track.csv' if counter == '0' else f'{date}_track_{counter}.csv'
-
-            self.csv_path = os.path.join(self.output_dir, csv_name)
+            self.csv_path = data['track_path']
 
     def find_gps_port(self) -> str:
         '''
@@ -95,7 +118,7 @@ class GpsManager:
                                     self.sentence_types[i] = sentence_str
                                     self.port = port.device
                         if self.sentence_types == gps_sentences: # If all valid sentence types were already found, quit searching
-                            self.init_gps_thread()
+                            self.init_gps_task()
                             return ''
             except Exception as e:
                 return f'Error accessing port {port.device}: {e}'
@@ -103,54 +126,90 @@ class GpsManager:
         if not self.port:
             return 'Could not find a connected GPS'
         else:
-            self.init_gps_thread()
+            self.init_gps_task()
             return ''
 
-    def init_gps_thread(self):
-        '''Starts thread for regularly reading coordinates in the background'''
-        # daemon=True ensures thread exits when mainloop terminates
-        self.gps_thread = threading.Thread(target=self.start_reading, daemon=True)
-        self.gps_thread.start()
+    def init_gps_task(self):
+        '''Starts task on the io loop for regularly reading coordinates'''
+        self.gps_task = self.io.submit(self.start_reading())
+
+    def open_serial(self):
+        '''Opens the GPS serial port'''
+        return serial.Serial(port=self.port, baudrate=self.baud_rate, timeout=1)
 
-    def start_reading(self):
+    async def start_reading(self):
         '''Tries to read coordinates every 2 seconds'''
-        time.sleep(1) # Wait 1 sec to ensure serial port was properly closed before opening again
-        with serial.Serial(port=self.port, baudrate=self.baud_rate, timeout=1) as ser:
+        await asyncio.sleep(1) # Wait 1 sec to ensure serial port was properly closed before opening again
+        ser = await self.io.run_blocking(self.open_serial)
+        try:
             while True:
-                self.coords = self.read_coords(ser)
-                self.time = datetime.now().time().replace(microsecond=0)
-                row = [self.time, self.coords[0], self.coords[1]]
-                
+                # Blocking serial reads happen in the executor, state updates on the loop
                 try:
-                    self.temp_track_df.loc[len(self.temp_track_df)] = row
-                except:
-                    pass
+                    fix = await self.io.run_blocking(self.read_coords, ser)
+                    self.add_fix(fix)
+                except Exception:
+                    # One bad read must not stop the track for the rest of the flight
+                    traceback.print_exc()
+                    self.callback('show read error')
 
-                if self.create_output:
+                if self.create_output and len(self.track_spool) >= self.batch_size:
                     self.save()
 
-                time.sleep(2)
+                await asyncio.sleep(2)
+        finally:
+            ser.close()
 
-    def read_coords(self, ser) -> tuple[float]:
+    def add_fix(self, fix):
         '''
-        - Attempts to read and return coordinates from the GPS
-        - Upon failure, displays an error message in the GUI and returns
-        the last recorded coordinates instead
+        - Updates the GPS clock, coordinates and effort statistics with a fix
+        from read_coords (or counts it as dropped if it is None)
+        - Spools a track row at the fix's GPS time
         '''
-        lat, lon = 0.0, 0.0
+        if fix:
+            lat, lon, time_of_day, day, received_at = fix
+            gps_time = self.clock.to_datetime(time_of_day, received_at, day)
+            self.clock.update(gps_time, received_at)
+
+            self.coords = (lat, lon)
+            self.time = format_time(gps_time)
+            self.effort_stats.add_fix(gps_time.timestamp(), lat, lon, self.create_output)
+            self.callback('new fix', self.coords)
+        else:
+            # Last coords are repeated at the estimated GPS time
+            self.time = format_time(self.clock.now())
+            self.effort_stats.add_dropped()
+        self.callback('update stats', self.get_effort_summary())
+        self.track_spool.append([self.time, self.coords[0], self.coords[1]])
+
+    def read_coords(self, ser) -> tuple:
+        '''
+        - Attempts to read coordinates and their UTC time from the GPS
+        - Returns (lat, lon, time_of_day, day, received_at), where day is the
+        sentence's date (RMC only, otherwise None) and received_at is the
+        system time the sentence arrived
+        - Lines buffered since the last read are dropped first, so received_at
+        isn't skewed by how long a stale line waited in the buffer
+        - Sentences with unreadable coordinates, times or dates are skipped
+        - Upon failure, displays an error message in the GUI and returns None
+        - Runs in the io loop's executor, so it must not change session state
+        '''
+        fix = None
+        # Sentences pile up while the reader sleeps between fixes
+        ser.reset_input_buffer()
 
         start_time = time.time()
         # Read for valid sentence with valid data for 5 seconds
         while time.time() - start_time < 5:
             num_types = sum(element != None for element in self.sentence_types)
             line = ser.readline().decode('utf-8', errors='replace')
+            received_at = time.time()
             if line.startswith(self.sentence_types[0]):
                 # Ex: $GPGGA,123519.00,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,*47
                 parts = line.split(',')
                 try: # Use try-except for cases where sentence is incomplete
                     if parts[6] == '1' or parts[6] == '2':
-                        lat, lon = self.ddm2dd(((parts[2], parts[3]), (parts[4], parts[5])))
-                        self.coords = (lat, lon)
+                        fix = (*self.ddm2dd(((parts[2], parts[3]), (parts[4], parts[5]))),
+                               parse_time(parts[1]), None, received_at)
                         if self.callback('has read error'):
                             self.callback('clear errors')
                     break
@@ -161,8 +220,8 @@ class GpsManager:
                 parts = line.split(',')
                 try:
                     if parts[2] == 'A':
-                        lat, lon = self.ddm2dd(((parts[3], parts[4]), (parts[5], parts[6])))
-                        self.coords = (lat, lon)
+                        fix = (*self.ddm2dd(((parts[3], parts[4]), (parts[5], parts[6]))),
+                               parse_time(parts[1]), parse_date(parts[9]), received_at)
                         if self.callback('has read error'):
                             self.callback('clear errors')
                     break
@@ -173,18 +232,20 @@ class GpsManager:
                 parts = line.split(',')
                 try:
                     if parts[6] == 'A':
-                        lat, lon = self.ddm2dd(((parts[1], parts[2]), (parts[3], parts[4])))
-                        self.coords = (lat, lon)
+                        fix = (*self.ddm2dd(((parts[1], parts[2]), (parts[3], parts[4]))),
+                               parse_time(parts[5]), None, received_at)
                         if self.callback('has read error'):
                             self.callback('clear errors')
                     break
                 except:
                     pass
         # Shows read error if coords could not be updated and read error isn't already shown
-        if (lat, lon) == (0.0, 0.0) and not self.callback('has read error'):
-            self.callback('show read error')
+        if not fix or fix[:2] == (0.0, 0.0):
+            if not self.callback('has read error'):
+                self.callback('show read error')
+            return None
 
-        return self.coords
+        return fix
 
     def ddm2dd(self, coordinates: tuple[tuple[str]]) -> tuple[float]:
         '''
@@ -209,6 +270,15 @@ class GpsManager:
         return round(lat, 6), round(lon, 6)
     
     def save(self):
-        '''Writes the contents of the temp track dataframe to the track csv'''
-        self.temp_track_df.to_csv(self.csv_path, mode='a', index=False, header=False)
-        self.temp_track_df = self.temp_track_df.iloc[0:0]
\ No newline at end of file
+        '''Writes the spooled track rows to the track csv (or its SQLite store)'''
+        if not self.csv_path:
+            return
+        if self.store_for:
+            store = self.store_for(self.csv_path)
+            self.new_track_rows += self.track_spool.drain_batches(store.insert_fixes)
+        else:
+            self.new_track_rows += self.track_spool.drain_to(self.csv_path)
+
+    def discard_spool(self):
+        '''Drops track rows that were never written to a track csv'''
+        self.track_spool.discard()
\ No newline at end of file
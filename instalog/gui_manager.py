@@ -3,20 +3,21 @@ from tkinter import ttk, filedialog, messagebox
 from .path_utils import internal_path
 from .editable_treeview import EditableTreeview
 from .action import Action
-from .path_utils import new_path
+from .species_tally import SpeciesTally
+from .map_view import MapView
 from collections import deque
-from datetime import datetime
 import csv
 import os
 
 class GuiManager(tk.Tk):
-    def __init__(self, shortcuts, callback, output_dir, init_port_thread):
+    def __init__(self, shortcuts, callback, output_dir, init_port_search, tile_dir):
         super().__init__()
 
         self.shortcuts = shortcuts
         self.callback = callback
         self.output_dir = output_dir
-        self.init_port_thread = init_port_thread
+        self.init_port_search = init_port_search
+        self.tile_dir = tile_dir
 
         self.title('InstaLog')
         self.style = ttk.Style(self)
@@ -26,6 +27,10 @@ class GuiManager(tk.Tk):
         self.read_error_displayed = False
         self.obs_csv_path = None
         self.saved = False
+        self.save_job = None # Pending snapshot of the treeview for the obs csv writer
+        self.save_delay_ms = 500
+        self.tally = SpeciesTally()
+        self.tally_items = {}
 
         self.load_theme()
         self.create_general_frame()
@@ -33,14 +38,19 @@ class GuiManager(tk.Tk):
         self.create_csv_tools()
         self.create_entry_viewer()
         self.create_error_panel()
+        self.create_stats_panel()
+        self.create_export_panel()
+        self.create_view_notebook()
+        self.create_map_view()
         self.create_tree_frame()
+        self.create_tally_panel()
         self.create_treeview()
 
     def run(self):
         '''Runs the GUI'''
         self.withdraw() # Hide root while loading
         self.create_loading_screen()
-        self.init_port_thread()
+        self.init_port_search()
 
         self.mainloop()
 
@@ -57,6 +67,11 @@ class GuiManager(tk.Tk):
 
         window.unbind('<Map>') # Ensures window only centers upon creation
 
+    def set_shortcuts(self, shortcuts):
+        '''Replaces species shortcuts with reloaded ones'''
+        self.shortcuts = shortcuts
+        self.clear_settings_error()
+
     def has_read_error(self):
         '''Returns whether a read error is displayed'''
         return self.read_error_displayed
@@ -104,13 +119,13 @@ class GuiManager(tk.Tk):
         '''Creates and configures general frame'''
         self.frame = ttk.Frame(self)
         self.frame.grid(row=0, column=0, sticky='nsew')
-        self.make_grid_resizable(self.frame, 1, 2)
+        self.make_grid_resizable(self.frame, 1, 3)
 
     def create_widgets_frame(self):
         '''Creates and configures frame for widgets'''
         self.widgets_frame = ttk.Frame(self.frame)
         self.widgets_frame.grid(row=0, column=0, padx=20, pady=10, sticky='nsew')
-        self.make_grid_resizable(self.widgets_frame, 3, 1)
+        self.make_grid_resizable(self.widgets_frame, 5, 1)
 
     def create_csv_tools(self):
         '''Creates CSV widgets'''
@@ -168,20 +183,91 @@ class GuiManager(tk.Tk):
                                      anchor='center')
         self.error_label.grid(row=0, column=0, padx=10, pady=10, sticky='nsew')
 
+    def create_stats_panel(self):
+        '''Creates panel showing live effort statistics'''
+        self.stats_labelframe = ttk.LabelFrame(self.widgets_frame, text='Effort', labelanchor='n')
+        self.stats_labelframe.grid(row=3, column=0, pady=(0, 10), sticky='nsew')
+        self.make_grid_resizable(self.stats_labelframe, 1, 1)
+
+        self.stats_frame = ttk.Frame(self.stats_labelframe)
+        self.stats_frame.grid(row=0, column=0, sticky='nsew')
+        self.make_grid_resizable(self.stats_frame, 1, 1)
+
+        self.stats_label = ttk.Label(self.stats_frame, justify='left', anchor='w')
+        self.stats_label.grid(row=0, column=0, padx=10, pady=10, sticky='nsew')
+        self.show_stats({})
+
+    def show_stats(self, summary):
+        '''Displays effort statistics in the effort panel'''
+        lines = [
+            f'Distance: {summary.get("DistanceKm", 0.0):.2f} km',
+            f'Speed: {summary.get("SpeedKn", 0.0):.1f} kn',
+            f'Time on effort: {summary.get("TimeOnEffort", "0:00:00")}',
+            f'Dropped fixes: {summary.get("DroppedFixes", 0)}'
+        ]
+        if summary.get('OffsetMs') is not None:
+            lines.append(f'Clock offset: {summary["OffsetMs"]:+.0f} ms ({summary["DriftPpm"]:+.1f} ppm)')
+        self.stats_label.config(text='\n'.join(lines))
+
+    def create_export_panel(self):
+        '''Creates panel showing background export progress'''
+        self.export_labelframe = ttk.LabelFrame(self.widgets_frame, text='Export', labelanchor='n')
+        self.export_labelframe.grid(row=4, column=0, pady=(0, 10), sticky='nsew')
+        self.make_grid_resizable(self.export_labelframe, 1, 1)
+
+        self.export_frame = ttk.Frame(self.export_labelframe)
+        self.export_frame.grid(row=0, column=0, sticky='nsew')
+        self.make_grid_resizable(self.export_frame, 3, 1)
+
+        self.export_label = ttk.Label(self.export_frame, text='No exports running', anchor='center')
+        self.export_label.grid(row=0, column=0, padx=10, pady=(10, 5), sticky='nsew')
+
+        self.export_progressbar = ttk.Progressbar(self.export_frame, mode='determinate', maximum=1)
+        self.export_progressbar.grid(row=1, column=0, padx=10, pady=(0, 5), sticky='ew')
+
+        self.cancel_export_button = ttk.Button(self.export_frame,
+                                               text='Cancel export',
+                                               command=lambda: self.callback('cancel export'))
+        self.cancel_export_button.grid(row=2, column=0, padx=10, pady=(0, 10), sticky='nsew')
+
+    def show_export_progress(self, done, total, message):
+        '''Updates export panel with the progress of the running export'''
+        self.export_progressbar.config(maximum=total, value=done)
+        self.export_label.config(text=message)
+
     def show_error(self, message):
         '''Displays an error in the error panel'''
         self.error_label.config(text=message, background='red')
         self.read_error_displayed = True
 
+    def show_settings_error(self, message):
+        '''Displays a settings error in the error panel without marking a read error'''
+        self.error_label.config(text=message, background='red')
+
+    def clear_settings_error(self):
+        '''Clears a settings error unless a read error is displayed'''
+        if not self.read_error_displayed:
+            self.clear_errors()
+
     def clear_errors(self):
         '''Clears the errors in the error panel'''
         self.error_label.config(text='', background='white')
         self.read_error_displayed = False
 
+    def create_view_notebook(self):
+        '''Creates notebook for switching between the table and the map'''
+        self.view_notebook = ttk.Notebook(self.frame)
+        self.view_notebook.grid(row=0, column=1, padx=(0, 20), pady=10, sticky='nsew')
+
+    def create_map_view(self):
+        '''Creates map of the live track and observations'''
+        self.map_view = MapView(self.view_notebook, self.tile_dir)
+
     def create_tree_frame(self):
         '''Creates and configures the treeview frame'''
-        self.tree_frame = ttk.Frame(self.frame)
-        self.tree_frame.grid(row=0, column=1, padx=(0, 20), pady=10, sticky='nsew')
+        self.tree_frame = ttk.Frame(self.view_notebook)
+        self.view_notebook.add(self.tree_frame, text='Table')
+        self.view_notebook.add(self.map_view, text='Map')
 
         # Custom grid configs to account for scrollbars
         self.tree_frame.grid_rowconfigure(0, weight=1)
@@ -193,7 +279,7 @@ class GuiManager(tk.Tk):
         self.col_widths = {
             'Species': 250,
             'Count': 75,
-            'Time': 150,
+            'Time': 200,
             'Obs': 75,
             'Comment': 200,
             'Latitude': 150,
@@ -201,6 +287,7 @@ class GuiManager(tk.Tk):
         }
         self.tree = EditableTreeview(self.tree_frame,
                                      self.save,
+                                     self.on_cell_edit,
                                      show='headings',
                                      columns=list(self.col_widths.keys()),
                                      height=20)
@@ -220,6 +307,35 @@ class GuiManager(tk.Tk):
 
         self.reset_treeview()
 
+    def create_tally_panel(self):
+        '''Creates the panel showing running totals for each species'''
+        self.tally_labelframe = ttk.LabelFrame(self.frame, text='Species Tally', labelanchor='n')
+        self.tally_labelframe.grid(row=0, column=2, padx=(0, 20), pady=10, sticky='nsew')
+
+        # Custom grid configs to account for scrollbar
+        self.tally_labelframe.grid_rowconfigure(0, weight=1)
+        self.tally_labelframe.grid_columnconfigure(0, weight=1)
+        self.tally_labelframe.grid_columnconfigure(1, weight=0)
+
+        tally_col_widths = {
+            'Species': 200,
+            'Sightings': 75,
+            'Total': 75
+        }
+        self.tally_tree = ttk.Treeview(self.tally_labelframe,
+                                       show='headings',
+                                       columns=list(tally_col_widths.keys()),
+                                       height=20)
+        self.tally_tree.grid(row=0, column=0, padx=(5, 0), pady=5, sticky='nsew')
+
+        self.tally_yscroll = ttk.Scrollbar(self.tally_labelframe, orient='vertical', command=self.tally_tree.yview)
+        self.tally_yscroll.grid(row=0, column=1, pady=5, sticky='ns')
+        self.tally_tree.configure(yscrollcommand=self.tally_yscroll.set)
+
+        for heading, width in tally_col_widths.items():
+            self.tally_tree.heading(heading, text=heading, anchor='w')
+            self.tally_tree.column(heading, width=width, anchor='w')
+
     #####################
     # MECHANICS METHODS #
     #####################
@@ -235,6 +351,50 @@ class GuiManager(tk.Tk):
         '''Clears the entries in the current treeview'''
         for item in self.tree.get_children():
             self.tree.delete(item)
+        self.reset_tally()
+        self.map_view.reset_obs()
+
+    def reset_tally(self):
+        '''Clears the species totals and their panel'''
+        self.tally.reset()
+        self.tally_items.clear()
+        self.tally_tree.delete(*self.tally_tree.get_children())
+
+    def row_added(self, row):
+        '''Updates the species totals and map for an added row'''
+        self.tally_add(row)
+        self.map_view.add_obs(row[5], row[6])
+
+    def row_removed(self, row):
+        '''Updates the species totals and map for a removed row'''
+        self.tally_remove(row)
+        self.map_view.remove_obs(row[5], row[6])
+
+    def tally_add(self, row):
+        '''Adds a row to the species totals'''
+        self.update_tally_item(self.tally.add(row))
+
+    def tally_remove(self, row):
+        '''Removes a row from the species totals'''
+        self.update_tally_item(self.tally.remove(row))
+
+    def update_tally_item(self, species):
+        '''Refreshes the panel entry of a single species'''
+        totals = self.tally.get(species)
+        iid = self.tally_items.get(species)
+        if not totals:
+            if iid:
+                self.tally_tree.delete(iid)
+                del self.tally_items[species]
+        elif iid:
+            self.tally_tree.item(iid, values=(species, *totals))
+        else:
+            self.tally_items[species] = self.tally_tree.insert('', tk.END, values=(species, *totals))
+
+    def on_cell_edit(self, old_values, new_values):
+        '''Moves an edited row's contribution from its old values to its new values'''
+        self.row_removed(old_values)
+        self.row_added(new_values)
 
     def new_csv(self):
         '''
@@ -244,6 +404,7 @@ class GuiManager(tk.Tk):
         # Want to save everything before making new CSV
         if self.obs_csv_path:
             self.save()
+            self.flush_save()
             self.callback('save work before new')
 
         self.reset_treeview()
@@ -259,74 +420,126 @@ class GuiManager(tk.Tk):
 
     def load_csv(self):
         '''
-        - Prompts the user to select a CSV file
-        - If provided, fills the treeview with the entries from the CSV
+        - Lets the user pick a session from the catalog, or browse for a CSV
+        when there are no cataloged sessions
         '''
-        filepath = filedialog.askopenfilename(filetypes=[('CSV files', '*.csv')])
+        sessions = self.callback('list sessions')
+        if sessions:
+            self.create_session_picker(sessions)
+        else:
+            self.browse_csv()
+
+    def create_session_picker(self, sessions):
+        '''Creates a window listing cataloged sessions to continue'''
+        self.picker = tk.Toplevel(self)
+        self.picker.title('Load Session')
+        self.picker.transient(self)
+        self.make_grid_resizable(self.picker, 1, 1)
+
+        picker_frame = ttk.Frame(self.picker)
+        picker_frame.grid(row=0, column=0, padx=15, pady=15, sticky='nsew')
+        picker_frame.grid_rowconfigure(0, weight=1)
+        picker_frame.grid_columnconfigure(0, weight=1)
+
+        picker_col_widths = {
+            'Session': 200,
+            'Obs rows': 75,
+            'Track rows': 75,
+            'Start': 100,
+            'End': 100
+        }
+        picker_tree = ttk.Treeview(picker_frame,
+                                   show='headings',
+                                   columns=list(picker_col_widths.keys()),
+                                   selectmode='browse',
+                                   height=10)
+        picker_tree.grid(row=0, column=0, columnspan=3, pady=(0, 15), sticky='nsew')
+        for heading, width in picker_col_widths.items():
+            picker_tree.heading(heading, text=heading, anchor='w')
+            picker_tree.column(heading, width=width, anchor='w')
+
+        sessions_by_iid = {}
+        for session in sessions:
+            name = os.path.splitext(os.path.basename(session['obs_path']))[0]
+            values = (name, session['obs_rows'], session['track_rows'],
+                      session['start_time'] or '', session['end_time'] or '')
+            sessions_by_iid[picker_tree.insert('', tk.END, values=values)] = session
+
+        def load_selected(event=None):
+            selected = picker_tree.selection()
+            if selected:
+                self.picker.destroy()
+                self.load_session(sessions_by_iid[selected[0]])
+
+        def browse():
+            self.picker.destroy()
+            self.browse_csv()
+
+        picker_tree.bind('<Double-1>', load_selected)
+        ttk.Button(picker_frame, text='Load', command=load_selected).grid(row=1, column=0, padx=(0, 15), sticky='nsew')
+        ttk.Button(picker_frame, text='Browse...', command=browse).grid(row=1, column=1, padx=(0, 15), sticky='nsew')
+        ttk.Button(picker_frame, text='Cancel', command=self.picker.destroy).grid(row=1, column=2, sticky='nsew')
+
+        self.picker.bind('<Map>', lambda event, w=self.picker: self.center_window(w))
+
+    def browse_csv(self):
+        '''Prompts the user to select an obs CSV file and loads it'''
+        filepath = filedialog.askopenfilename(initialdir=self.output_dir, filetypes=[('CSV files', '*.csv')])
         if filepath:
-            if not self.loaded_csv_valid(filepath):
+            session = self.callback('find session', {'path': filepath})
+            if not session:
                 messagebox.showerror('Error', 'Invalid filename')
                 return
-            with open(filepath) as file:
-                self.reset_treeview()
-                self.undo_stack.clear()
-
-                csvFile = csv.reader(file)
-                headers = next(csvFile)
-                if headers != list(self.col_widths.keys()):
-                    messagebox.showerror('Error', 'CSV headers do not match')
-                    return
-                else:
-                    for row in csvFile:
-                        self.tree.insert("", tk.END, values=row)
-
-                items = self.tree.get_children()
-                if items:
-                    last_item = items[-1]
-                    vals = self.tree.item(last_item).get('values')
-                    obs = int(vals[3])
-                    coords = (float(vals[5]), float(vals[6]))
-                self.tree.set_num_observers(obs)
-                data = {'coords': coords}
-                self.callback('set coords', data)
-
-                self.obs_csv_path = filepath
-
-                filename = os.path.basename(filepath)
-                root, ext = os.path.splitext(filename)
-                # Ex: root = 07Sep2024_obs
-                # Ex: root = 07Sep2024_obs_1
-                parts = root.split('_')
-                date = parts[0]
-                counter = '0' if len(parts) == 2 else parts[2]
-                data = {
-                    'status': True,
-                    'date': date,
-                    'counter': counter
-                }
-                if self.saved:
-                    self.callback('save work before new')
-                self.callback('continue data', data)
-                self.save()
-
-                self.viewer.focus_set()
-
-    def loaded_csv_valid(self, filepath) -> bool:
-        '''Checks a few conditions to determine whether csv name is formatted correctly'''
-        filename = os.path.basename(filepath)
-        name, ext = os.path.splitext(filename)
-
-        parts = name.split('_')
-        if len(parts) == 2:
-            if len(parts[0]) != 9 or parts[1] != 'obs':
-                return False
-        elif len(parts) == 3:
-            if len(parts[0]) != 9 or parts[1] != 'obs' or not parts[2].isdigit():
-                return False
-        else:
-            return False
-        
-        return True
+            self.load_session(session)
+
+    def load_session(self, session):
+        '''Brings a session's obs CSV up to date in the background, which then calls open_session'''
+        # The file is read once synced, so pending saves must reach it first
+        self.flush_save()
+        self.callback('sync session', session)
+
+    def open_session(self, session):
+        '''Fills the treeview with the entries from a session's obs CSV and continues it'''
+        filepath = session['obs_path']
+        # Rows entered while syncing belong to the previous session
+        self.flush_save()
+        if not os.path.exists(filepath):
+            messagebox.showerror('Error', f'Could not find {os.path.basename(filepath)}')
+            return
+        with open(filepath) as file:
+            self.reset_treeview()
+            self.undo_stack.clear()
+
+            csvFile = csv.reader(file)
+            headers = next(csvFile)
+            if headers != list(self.col_widths.keys()):
+                messagebox.showerror('Error', 'CSV headers do not match')
+                return
+            else:
+                for row in csvFile:
+                    self.tree.insert("", tk.END, values=row)
+                    self.row_added(row)
+
+            items = self.tree.get_children()
+            if items:
+                last_item = items[-1]
+                vals = self.tree.item(last_item).get('values')
+                obs = int(vals[3])
+                coords = (float(vals[5]), float(vals[6]))
+            self.tree.set_num_observers(obs)
+            data = {'coords': coords}
+            self.callback('set coords', data)
+
+            # Export previous session before switching to the loaded one
+            if self.saved:
+                self.callback('save work before new')
+            self.obs_csv_path = filepath
+
+            data = dict(session, status=True)
+            self.callback('continue data', data)
+            self.save()
+
+            self.viewer.focus_set()
 
     def delete_last_row(self):
         '''Deletes the contents of the last row in the treeview'''
@@ -334,6 +547,7 @@ class GuiManager(tk.Tk):
             last_item = self.tree.get_children()[-1]
             data = self.tree.item(last_item).get('values')
             self.tree.delete(last_item)
+            self.row_removed(data)
 
             self.save()
 
@@ -342,6 +556,7 @@ class GuiManager(tk.Tk):
     def undo_delete_last_row(self, data):
         '''Inserts deleted data back into treeview without adding an Action to the undo stack'''
         self.tree.insert("", tk.END, values=data)
+        self.row_added(data)
         self.tree.yview_moveto(1.0)
         self.save()
 
@@ -372,7 +587,7 @@ class GuiManager(tk.Tk):
             species = text.strip()
             count = '0'
 
-        # .upper because all shortcuts are uppercase
+        # .upper because all compiled shortcuts are uppercase
         if species.upper() in self.shortcuts:
             species = self.shortcuts[species.upper()]
 
@@ -383,26 +598,40 @@ class GuiManager(tk.Tk):
         return ''.join([char for char in s if char.isdigit()])
 
     def save(self):
-        '''Writes the contents of the treeview to the obs csv'''
-        # Creates a new CSV path if it does not exist
+        '''
+        - Marks the treeview as changed so its contents are written to the obs csv
+        - Changes within save_delay_ms share one snapshot, so the Tk thread
+        doesn't walk every row on each keystroke
+        '''
+        # Starts a new cataloged session if there is no obs CSV yet
         if not self.obs_csv_path:
-            date = datetime.today().strftime('%d%b%Y')
-            csv_name = f'{date}_obs'
-            self.obs_csv_path = os.path.join(self.output_dir, csv_name + '.csv')
-            if os.path.exists(self.obs_csv_path):
-                self.obs_csv_path = new_path(self.obs_csv_path)
-        
-        with open(self.obs_csv_path, 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(self.tree['columns'])
-            for child in self.tree.get_children():
-                row = self.tree.item(child).get('values')
-                writer.writerow(row)
+            session = self.callback('new session')
+            self.obs_csv_path = session['obs_path']
+
+        if not self.save_job:
+            self.save_job = self.after(self.save_delay_ms, self.send_save)
 
         if not self.saved:
             # Tells other managers to create output if current doc has been saved
             self.callback('set create output', True)
             self.saved = True
+
+    def send_save(self):
+        '''Sends one snapshot of the treeview to be written to the obs csv'''
+        self.save_job = None
+        # Only the snapshot is taken here, the writer does the disk work
+        data = {
+            'path': self.obs_csv_path,
+            'headers': self.tree['columns'],
+            'rows': [self.tree.item(child).get('values') for child in self.tree.get_children()]
+        }
+        self.callback('write obs', data)
+
+    def flush_save(self):
+        '''Sends a pending snapshot right away'''
+        if self.save_job:
+            self.after_cancel(self.save_job)
+            self.send_save()
     
     def add_row(self):
         '''Retrieves the necessary data, adds a row to the treeview, and updates the CSV'''
@@ -415,6 +644,7 @@ class GuiManager(tk.Tk):
 
         row = [species, count, time, obs, comment, latitude, longitude]
         self.tree.insert("", tk.END, values=row)
+        self.row_added(row)
 
         self.tree.yview_moveto(1.0) # Scrolls treeview down if necessary
         self.save()
@@ -425,6 +655,8 @@ class GuiManager(tk.Tk):
         '''Removes last row without adding an Action to the undo stack'''
         if self.tree.get_children():
             last_item = self.tree.get_children()[-1]
+            data = self.tree.item(last_item).get('values')
             self.tree.delete(last_item)
+            self.row_removed(data)
 
             self.save()
\ No newline at end of file
@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import queue
+import traceback
+
+class IoLoop:
+    '''Owns a single asyncio event loop running in a background thread'''
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        # daemon=True ensures thread can't keep the app alive after stop() is skipped
+        self.thread = threading.Thread(target=self.run_loop, name='io-loop', daemon=True)
+
+    def start(self):
+        '''Starts the event loop thread'''
+        self.thread.start()
+
+    def run_loop(self):
+        '''Runs the event loop until stopped'''
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        '''Schedules a coroutine on the loop and returns a concurrent Future'''
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call(self, func, *args):
+        '''Runs a regular function on the loop thread and returns a concurrent Future'''
+        async def wrapper():
+            return func(*args)
+        return self.submit(wrapper())
+
+    def run(self, func, *args):
+        '''Runs a regular function on the loop thread and waits for its result'''
+        if threading.current_thread() is self.thread:
+            return func(*args)
+        return self.call(func, *args).result()
+
+    async def run_blocking(self, func, *args):
+        '''Runs a blocking function in the loop's executor so the loop stays responsive'''
+        return await self.loop.run_in_executor(None, func, *args)
+
+    def stop(self):
+        '''Cancels remaining tasks, stops the loop and waits for its thread'''
+        if not self.thread.is_alive():
+            return
+        self.submit(self.cancel_tasks()).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    async def cancel_tasks(self):
+        '''Cancels every task except the calling one and waits for them to finish'''
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.loop.shutdown_default_executor()
+
+class TkBridge:
+    '''
+    - Passes function calls from background threads to the Tk thread
+    - The Tk thread is only woken (through a virtual event) when the queue
+    goes from empty to non-empty, so an idle session costs no wakeups
+    '''
+    EVENT = '<<TkBridgeCalls>>'
+
+    def __init__(self):
+        self.calls = queue.SimpleQueue()
+        self.widget = None
+        self.lock = threading.Lock()
+        self.wake_pending = False
+
+    def attach(self, widget):
+        '''Starts running queued calls on the given widget's mainloop'''
+        # Bound before posts can see the widget so no wakeup is lost
+        widget.bind(self.EVENT, lambda event: self.drain())
+        self.widget = widget
+        # Calls posted before the widget existed
+        self.widget.after_idle(self.drain)
+
+    def post(self, func, *args):
+        '''Queues a call to run on the Tk thread, waking it if nothing was pending'''
+        self.calls.put((func, args))
+        with self.lock:
+            if self.wake_pending or not self.widget:
+                return
+            self.wake_pending = True
+        try:
+            self.widget.event_generate(self.EVENT, when='tail')
+        except Exception:
+            pass # Widget was destroyed
+
+    def drain(self):
+        '''
+        - Runs all queued calls
+        - A failing call is reported without stopping later calls
+        '''
+        # Cleared first so calls posted while draining wake the Tk thread again
+        with self.lock:
+            self.wake_pending = False
+        while True:
+            try:
+                func, args = self.calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
+            except Exception:
+                traceback.print_exc()
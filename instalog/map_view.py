@@ -0,0 +1,381 @@
+import tkinter as tk
+from tkinter import ttk
+from collections import OrderedDict
+from array import array
+import math
+import time
+import csv
+import os
+
+TILE_SIZE = 256
+MAX_LATITUDE = 85.05112878 # Web Mercator cuts off here
+
+def project(lat, lon) -> tuple[float]:
+    '''Projects coordinates to Web Mercator world coordinates between 0 and 1'''
+    lat = max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)
+    sin_lat = math.sin(math.radians(lat))
+    x = (lon + 180) / 360
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return x, y
+
+def read_track_points(track_csv_path) -> list[tuple[float]]:
+    '''Reads (lat, lon) of every readable fix in a track csv'''
+    points = []
+    with open(track_csv_path, newline='') as file:
+        for row in csv.DictReader(file):
+            try:
+                point = (float(row['Latitude']), float(row['Longitude']))
+            except (ValueError, TypeError, KeyError):
+                continue
+            if point != (0.0, 0.0):
+                points.append(point)
+    return points
+
+class TileCache:
+    '''
+    - LRU cache of decoded basemap tiles read from an offline tile folder
+    - Tiles are pre-seeded as {tile_dir}/{zoom}/{x}/{y}.png
+    '''
+    def __init__(self, tile_dir, max_tiles=200):
+        self.tile_dir = tile_dir
+        self.max_tiles = max_tiles
+        self.tiles = OrderedDict() # (zoom, x, y) -> PhotoImage or None if missing
+
+    def get(self, zoom, x, y):
+        '''Returns the tile image or None if it isn't in the tile folder'''
+        key = (zoom, x, y)
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+
+        image = None
+        path = os.path.join(self.tile_dir, str(zoom), str(x), f'{y}.png')
+        if os.path.exists(path):
+            try:
+                image = tk.PhotoImage(file=path)
+            except tk.TclError:
+                pass # Unreadable tiles are drawn as blank
+
+        self.tiles[key] = image
+        if len(self.tiles) > self.max_tiles:
+            self.tiles.popitem(last=False)
+        return image
+
+class TrackRun:
+    '''
+    - Consecutive projected fixes stored as a flat array of x, y pairs with
+    their bounding box, so runs outside the view can be skipped as a whole
+    - Each run starts at the last fix of the previous run so the line between
+    them is drawn with either
+    '''
+    def __init__(self):
+        self.coords = array('d')
+        self.min_x = self.min_y = math.inf
+        self.max_x = self.max_y = -math.inf
+
+    def __len__(self):
+        return len(self.coords) // 2
+
+    def add(self, x, y):
+        '''Adds a fix and grows the bounding box'''
+        self.coords.extend((x, y))
+        self.min_x, self.max_x = min(self.min_x, x), max(self.max_x, x)
+        self.min_y, self.max_y = min(self.min_y, y), max(self.max_y, y)
+
+    def overlaps(self, min_x, min_y, max_x, max_y):
+        '''Returns whether the run's bounding box overlaps the given box'''
+        return self.min_x <= max_x and self.max_x >= min_x and self.min_y <= max_y and self.max_y >= min_y
+
+class TrackLevels:
+    '''
+    - Track decimated separately for every zoom level as fixes arrive
+    - A fix is kept at a level only if it is at least tolerance pixels from
+    the last fix kept there
+    - Each level is split into runs of at most run_size fixes
+    '''
+    def __init__(self, min_zoom, max_zoom, tolerance=2, run_size=256):
+        self.tolerance = tolerance
+        self.run_size = run_size
+        self.levels = {zoom: [] for zoom in range(min_zoom, max_zoom + 1)}
+        self.last = {zoom: None for zoom in self.levels} # Last fix kept at each level
+
+    def reset(self):
+        '''Clears every level'''
+        for zoom, runs in self.levels.items():
+            runs.clear()
+            self.last[zoom] = None
+
+    def add(self, x, y):
+        '''Adds a projected fix to every level it is visible at'''
+        for zoom, runs in self.levels.items():
+            last = self.last[zoom]
+            if last:
+                scale = TILE_SIZE * 2 ** zoom
+                if abs(x - last[0]) * scale < self.tolerance and abs(y - last[1]) * scale < self.tolerance:
+                    continue
+            if not runs or len(runs[-1]) >= self.run_size:
+                run = TrackRun()
+                if last:
+                    run.add(*last)
+                runs.append(run)
+            runs[-1].add(x, y)
+            self.last[zoom] = (x, y)
+
+    def get(self, zoom):
+        '''Returns the runs of decimated fixes for a zoom level'''
+        return self.levels[zoom]
+
+class MapView(ttk.Frame):
+    '''Map of the live track and observations drawn over offline basemap tiles'''
+    def __init__(self, master, tile_dir, min_zoom=3, max_zoom=17, zoom=12, frame_budget_ms=30, **kwargs):
+        super().__init__(master, **kwargs)
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.zoom = zoom
+        self.frame_budget = frame_budget_ms / 1000
+
+        self.tiles = TileCache(tile_dir)
+        self.track = TrackLevels(min_zoom, max_zoom)
+        self.observations = []
+        self.current = None # Projected position of the latest fix
+        self.center = project(0.0, 0.0)
+        self.follow = True # Keep the latest fix centered until the user pans
+        self.lod_bias = 0 # Zoom levels to coarsen the track by when over the frame budget
+        self.slow_frames = 0 # Consecutive frames over the frame budget
+        self.redraw_job = None
+        self.drag_start = None
+
+        self.make_grid_resizable()
+        self.create_canvas()
+        self.create_controls()
+
+    def make_grid_resizable(self):
+        '''Lets the canvas take all extra space'''
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+    def create_canvas(self):
+        '''Creates the map canvas and its mouse bindings'''
+        self.canvas = tk.Canvas(self, background='#dfe9ef', highlightthickness=0)
+        self.canvas.grid(row=0, column=0, sticky='nsew')
+
+        self.canvas.bind('<Configure>', lambda event: self.schedule_redraw(0))
+        self.canvas.bind('<Map>', lambda event: self.schedule_redraw(0))
+        self.canvas.bind('<ButtonPress-1>', self.on_press)
+        self.canvas.bind('<B1-Motion>', self.on_drag)
+        self.canvas.bind('<MouseWheel>', self.on_mousewheel)
+
+    def create_controls(self):
+        '''Creates zoom and centering buttons'''
+        self.controls_frame = ttk.Frame(self)
+        self.controls_frame.grid(row=1, column=0, pady=(5, 0), sticky='ew')
+
+        self.zoom_in_button = ttk.Button(self.controls_frame, text='+', width=3, command=lambda: self.change_zoom(1))
+        self.zoom_in_button.grid(row=0, column=0, padx=(0, 5))
+
+        self.zoom_out_button = ttk.Button(self.controls_frame, text='-', width=3, command=lambda: self.change_zoom(-1))
+        self.zoom_out_button.grid(row=0, column=1, padx=(0, 5))
+
+        self.center_button = ttk.Button(self.controls_frame, text='Center on GPS', command=self.center_on_gps)
+        self.center_button.grid(row=0, column=2)
+
+    ################
+    # DATA METHODS #
+    ################
+
+    def add_fix(self, lat, lon):
+        '''Adds a GPS fix to the track'''
+        self.current = project(lat, lon)
+        self.track.add(*self.current)
+        if self.follow:
+            self.center = self.current
+        # New fixes arrive every few seconds, so one redraw per second is plenty
+        self.schedule_redraw(1000)
+
+    def add_fixes(self, points):
+        '''Adds a list of (lat, lon) fixes, e.g. from a loaded track'''
+        for lat, lon in points:
+            self.current = project(lat, lon)
+            self.track.add(*self.current)
+        if self.follow and self.current:
+            self.center = self.current
+        self.schedule_redraw(0)
+
+    def reset_track(self):
+        '''Clears the track'''
+        self.track.reset()
+        self.schedule_redraw(0)
+
+    def add_obs(self, lat, lon):
+        '''Adds an observation point'''
+        point = self.project_obs(lat, lon)
+        if point:
+            self.observations.append(point)
+            self.schedule_redraw(0)
+
+    def remove_obs(self, lat, lon):
+        '''Removes the most recent observation point at the given coordinates'''
+        point = self.project_obs(lat, lon)
+        if point in self.observations:
+            # Rows are usually removed from the end, so search backwards
+            index = len(self.observations) - 1 - self.observations[::-1].index(point)
+            del self.observations[index]
+            self.schedule_redraw(0)
+
+    def reset_obs(self):
+        '''Clears all observation points'''
+        self.observations.clear()
+        self.schedule_redraw(0)
+
+    def project_obs(self, lat, lon):
+        '''Projects observation coordinates, returning None if they are unreadable or unset'''
+        try:
+            lat, lon = float(lat), float(lon)
+        except (ValueError, TypeError):
+            return None
+        if (lat, lon) == (0.0, 0.0):
+            return None
+        return project(lat, lon)
+
+    ######################
+    # NAVIGATION METHODS #
+    ######################
+
+    def change_zoom(self, step):
+        '''Zooms in or out by step levels'''
+        self.zoom = max(self.min_zoom, min(self.max_zoom, self.zoom + step))
+        self.schedule_redraw(0)
+
+    def center_on_gps(self):
+        '''Centers on the latest fix and follows it again'''
+        self.follow = True
+        if self.current:
+            self.center = self.current
+        self.schedule_redraw(0)
+
+    def on_press(self, event):
+        '''Starts dragging the map'''
+        self.drag_start = (event.x, event.y)
+
+    def on_drag(self, event):
+        '''Pans the map with the mouse and stops following the GPS'''
+        if not self.drag_start:
+            return
+        scale = TILE_SIZE * 2 ** self.zoom
+        dx = event.x - self.drag_start[0]
+        dy = event.y - self.drag_start[1]
+        self.center = (self.center[0] - dx / scale, self.center[1] - dy / scale)
+        self.drag_start = (event.x, event.y)
+        self.follow = False
+        self.schedule_redraw(0)
+
+    def on_mousewheel(self, event):
+        '''Zooms with the mouse wheel'''
+        self.change_zoom(1 if event.delta > 0 else -1)
+
+    ###################
+    # DRAWING METHODS #
+    ###################
+
+    def schedule_redraw(self, delay_ms):
+        '''Coalesces redraw requests into a single redraw'''
+        if self.redraw_job:
+            if delay_ms:
+                return
+            self.after_cancel(self.redraw_job)
+        self.redraw_job = self.after(delay_ms, self.redraw)
+
+    def redraw(self):
+        '''Redraws tiles, track and observations for the current view'''
+        self.redraw_job = None
+        # Nothing to do while the map tab is hidden
+        if not self.canvas.winfo_ismapped():
+            return
+
+        start = time.perf_counter()
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        scale = TILE_SIZE * 2 ** self.zoom
+        left = self.center[0] * scale - width / 2
+        top = self.center[1] * scale - height / 2
+
+        self.canvas.delete('all')
+        self.draw_tiles(left, top, width, height)
+        self.draw_track(left, top, width, height, scale)
+        self.draw_observations(left, top, width, height, scale)
+        self.draw_current(left, top, scale)
+
+        # Culling normally keeps frames on budget, so the track is only coarsened
+        # as a last resort after several slow frames in a row
+        elapsed = time.perf_counter() - start
+        self.slow_frames = self.slow_frames + 1 if elapsed > self.frame_budget else 0
+        if self.slow_frames >= 3 and self.zoom - self.lod_bias > self.min_zoom:
+            self.lod_bias += 1
+            self.slow_frames = 0
+        elif elapsed < self.frame_budget / 4 and self.lod_bias > 0:
+            self.lod_bias -= 1
+
+    def draw_tiles(self, left, top, width, height):
+        '''Draws the basemap tiles covering the view'''
+        num_tiles = 2 ** self.zoom
+        for tile_x in range(math.floor(left / TILE_SIZE), math.floor((left + width) / TILE_SIZE) + 1):
+            for tile_y in range(math.floor(top / TILE_SIZE), math.floor((top + height) / TILE_SIZE) + 1):
+                if not 0 <= tile_y < num_tiles:
+                    continue
+                image = self.tiles.get(self.zoom, tile_x % num_tiles, tile_y)
+                if image:
+                    self.canvas.create_image(tile_x * TILE_SIZE - left, tile_y * TILE_SIZE - top,
+                                             image=image, anchor='nw')
+
+    def draw_track(self, left, top, width, height, scale):
+        '''
+        - Draws the track decimated for the current zoom as polylines
+        - Only runs whose bounding box overlaps the view are walked, so the
+        cost follows what is visible rather than the length of the track
+        '''
+        zoom = max(self.min_zoom, self.zoom - self.lod_bias)
+        margin = 50
+        view = ((left - margin) / scale, (top - margin) / scale,
+                (left + width + margin) / scale, (top + height + margin) / scale)
+        coords = []
+        for run in self.track.get(zoom):
+            if not run.overlaps(*view):
+                if len(coords) >= 4:
+                    self.canvas.create_line(*coords, fill='#1f5fbf', width=2)
+                coords = []
+                continue
+
+            points = run.coords
+            for i in range(0, len(points), 2):
+                px = points[i] * scale - left
+                py = points[i + 1] * scale - top
+                inside = -margin <= px <= width + margin and -margin <= py <= height + margin
+                if inside:
+                    coords.extend((px, py))
+                # Break the line where it leaves the view
+                else:
+                    if len(coords) >= 4:
+                        self.canvas.create_line(*coords, fill='#1f5fbf', width=2)
+                    coords = []
+        if len(coords) >= 4:
+            self.canvas.create_line(*coords, fill='#1f5fbf', width=2)
+
+    def draw_observations(self, left, top, width, height, scale):
+        '''Draws observation points inside the view'''
+        radius = 4
+        for x, y in self.observations:
+            px = x * scale - left
+            py = y * scale - top
+            if 0 <= px <= width and 0 <= py <= height:
+                self.canvas.create_oval(px - radius, py - radius, px + radius, py + radius,
+                                        fill='#e8590c', outline='white')
+
+    def draw_current(self, left, top, scale):
+        '''Draws the latest fix'''
+        if not self.current:
+            return
+        radius = 6
+        px = self.current[0] * scale - left
+        py = self.current[1] * scale - top
+        self.canvas.create_oval(px - radius, py - radius, px + radius, py + radius,
+                                fill='#1f5fbf', outline='white', width=2)
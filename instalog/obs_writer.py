@@ -0,0 +1,67 @@
+import asyncio
+import csv
+import os
+
+class ObsWriter:
+    '''
+    - Coalesces obs csv saves that arrive within a short debounce window
+    - Writes off the Tk thread to a temp file that is renamed over the csv,
+    or to the session's SQLite store when that backend is used
+    '''
+    def __init__(self, io, debounce=0.5, on_write=None, store_for=None):
+        self.io = io
+        self.debounce = debounce
+        self.on_write = on_write # Called with (path, headers, rows) after each write
+        self.store_for = store_for # Returns the SQLite store for a csv path
+
+        self.pending = None # (path, headers, rows) of the latest unwritten save
+        self.flush_handle = None
+        self.write_lock = asyncio.Lock()
+
+    def request(self, path, headers, rows):
+        '''Queues a save of the given rows, replacing any save still waiting'''
+        self.io.call(self.schedule, (path, headers, rows))
+
+    def schedule(self, snapshot):
+        '''Stores the latest snapshot and restarts the debounce timer (loop thread)'''
+        self.pending = snapshot
+        if self.flush_handle:
+            self.flush_handle.cancel()
+        self.flush_handle = self.io.loop.call_later(self.debounce,
+                                                    lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        '''Writes the pending snapshot if there is one'''
+        if self.flush_handle:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        async with self.write_lock:
+            snapshot, self.pending = self.pending, None
+            if snapshot:
+                await self.io.run_blocking(self.write, *snapshot)
+
+    def flush_now(self):
+        '''Writes any pending save and waits until it is on disk'''
+        self.io.submit(self.flush()).result()
+
+    def write(self, path, headers, rows):
+        '''Atomically writes rows to path through a temp file (or to its store)'''
+        if self.store_for:
+            self.store_for(path).replace_obs(rows)
+        else:
+            self.write_csv(path, headers, rows)
+
+        if self.on_write:
+            self.on_write(path, headers, rows)
+
+    def write_csv(self, path, headers, rows):
+        '''Writes rows to a temp file and renames it over path'''
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(headers)
+            writer.writerows(rows)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
@@ -0,0 +1,113 @@
+from collections import Counter
+import tracemalloc
+import threading
+import time
+import sys
+import os
+
+class SamplingProfiler:
+    '''
+    - Samples the stack of every thread (Tk main loop, io loop, executor
+    workers) at a fixed interval
+    - Takes tracemalloc snapshots at a slower interval
+    - Writes text reports to report_dir
+    '''
+    def __init__(self, report_dir, interval=0.01, snapshot_interval=60, top=30):
+        self.report_dir = report_dir
+        self.interval = interval
+        self.snapshot_interval = snapshot_interval
+        self.top = top
+
+        self.self_counts = Counter() # (thread, function) -> samples where function was running
+        self.total_counts = Counter() # (thread, function) -> samples where function was on the stack
+        self.thread_samples = Counter()
+        self.num_snapshots = 0
+        self.previous_snapshot = None
+
+        self.stop_event = threading.Event()
+        # daemon=True ensures a forgotten profiler can't keep the app alive
+        self.thread = threading.Thread(target=self.run, name='profiler', daemon=True)
+
+    def start(self):
+        '''Starts memory tracing and sampling'''
+        os.makedirs(self.report_dir, exist_ok=True)
+        tracemalloc.start(10)
+        self.thread.start()
+
+    def stop(self):
+        '''Stops sampling and writes the final reports'''
+        self.stop_event.set()
+        self.thread.join()
+        self.write_memory_report()
+        self.write_cpu_report()
+        tracemalloc.stop()
+
+    def run(self):
+        '''Samples stacks until stopped, snapshotting memory along the way'''
+        next_snapshot = time.monotonic() + self.snapshot_interval
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+            if time.monotonic() >= next_snapshot:
+                self.write_memory_report()
+                next_snapshot += self.snapshot_interval
+
+    def sample(self):
+        '''Records the current stack of every other thread'''
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == self.thread.ident:
+                continue
+            thread_name = names.get(thread_id, str(thread_id))
+            self.thread_samples[thread_name] += 1
+
+            seen = set()
+            self.self_counts[(thread_name, self.describe(frame))] += 1
+            while frame:
+                function = self.describe(frame)
+                # Recursive functions only count once per sample
+                if function not in seen:
+                    seen.add(function)
+                    self.total_counts[(thread_name, function)] += 1
+                frame = frame.f_back
+
+    def describe(self, frame):
+        '''Returns "function (file:line)" for a frame's code'''
+        code = frame.f_code
+        return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+    def write_cpu_report(self):
+        '''Writes the most sampled functions of each thread'''
+        with open(os.path.join(self.report_dir, 'cpu.txt'), 'w') as file:
+            file.write(f'Sampling interval: {self.interval * 1000:.0f} ms\n')
+            for thread_name, samples in self.thread_samples.most_common():
+                file.write(f'\n=== Thread {thread_name}: {samples} samples ===\n')
+                for title, counts in (('Self', self.self_counts), ('Total', self.total_counts)):
+                    file.write(f'\n{title}:\n')
+                    thread_counts = Counter({function: count for (name, function), count in counts.items()
+                                             if name == thread_name})
+                    for function, count in thread_counts.most_common(self.top):
+                        file.write(f'{100 * count / samples:6.1f}%  {count:8}  {function}\n')
+
+    def write_memory_report(self):
+        '''Writes the largest allocation sites and the growth since the last snapshot'''
+        if not tracemalloc.is_tracing():
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>')
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+
+        path = os.path.join(self.report_dir, f'memory_{self.num_snapshots:03}.txt')
+        with open(path, 'w') as file:
+            file.write(f'Traced memory: {current / 1e6:.1f} MB (peak {peak / 1e6:.1f} MB)\n')
+            file.write('\nLargest allocation sites:\n')
+            for stat in snapshot.statistics('lineno')[:self.top]:
+                file.write(f'{stat}\n')
+            if self.previous_snapshot:
+                file.write('\nGrowth since previous snapshot:\n')
+                for stat in snapshot.compare_to(self.previous_snapshot, 'lineno')[:self.top]:
+                    file.write(f'{stat}\n')
+
+        self.previous_snapshot = snapshot
+        self.num_snapshots += 1
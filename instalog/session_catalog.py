@@ -0,0 +1,180 @@
+import sqlite3
+import threading
+import os
+from datetime import datetime
+
+class SessionCatalog:
+    '''
+    - SQLite catalog of every session in an output directory
+    - Records each session's obs, track and export paths, row counts and
+    time range so sessions can be listed and named without probing files
+    '''
+    FILENAME = '.instalog_sessions.sqlite'
+    COLUMNS = ['id', 'date', 'counter', 'obs_path', 'track_path', 'obs_export_path',
+               'track_export_path', 'obs_rows', 'track_rows', 'start_time', 'end_time']
+
+    def __init__(self, output_dir):
+        self.output_dir = os.path.abspath(output_dir)
+        self.path = os.path.join(self.output_dir, self.FILENAME)
+        is_new = not os.path.exists(self.path)
+
+        # Used from the Tk thread and the io loop, so access is serialized by a lock
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id INTEGER PRIMARY KEY,
+                    date TEXT NOT NULL,
+                    counter INTEGER NOT NULL,
+                    obs_path TEXT NOT NULL UNIQUE,
+                    track_path TEXT NOT NULL,
+                    obs_export_path TEXT NOT NULL,
+                    track_export_path TEXT NOT NULL,
+                    obs_rows INTEGER NOT NULL DEFAULT 0,
+                    track_rows INTEGER NOT NULL DEFAULT 0,
+                    start_time TEXT,
+                    end_time TEXT,
+                    UNIQUE (date, counter)
+                )''')
+
+        # Folders from before the catalog existed are indexed once
+        if is_new:
+            self.scan()
+
+    def close(self):
+        '''Closes the catalog database'''
+        with self.lock:
+            self.conn.close()
+
+    def session_paths(self, date, counter) -> dict:
+        '''Returns the paths of every file belonging to a session'''
+        def name(type):
+            return f'{date}_{type}' if counter == 0 else f'{date}_{type}_{counter}'
+        return {
+            'obs_path': os.path.join(self.output_dir, name('obs') + '.csv'),
+            'track_path': os.path.join(self.output_dir, name('track') + '.csv'),
+            'obs_export_path': os.path.join(self.output_dir, name('obs'), name('obs') + '.shp'),
+            'track_export_path': os.path.join(self.output_dir, name('track'), name('track') + '.shp')
+        }
+
+    def allocate(self) -> dict:
+        '''Registers and returns a new session for today with the next free counter'''
+        date = datetime.today().strftime('%d%b%Y')
+        with self.lock, self.conn:
+            # (date, counter) is indexed, so this doesn't scan the table
+            row = self.conn.execute('SELECT MAX(counter) FROM sessions WHERE date = ?', (date,)).fetchone()
+            counter = 0 if row[0] is None else row[0] + 1
+
+            # Only files created outside the app can collide here
+            while any(os.path.exists(path) for path in self.session_paths(date, counter).values()):
+                counter += 1
+
+            self.insert(date, counter)
+        return self.find(date, counter)
+
+    def register(self, date, counter) -> dict:
+        '''Registers an existing session if needed and returns it'''
+        with self.lock, self.conn:
+            self.insert(date, counter)
+        return self.find(date, counter)
+
+    def insert(self, date, counter):
+        '''Inserts a session row unless it already exists (lock must be held)'''
+        paths = self.session_paths(date, counter)
+        self.conn.execute('''
+            INSERT OR IGNORE INTO sessions
+                (date, counter, obs_path, track_path, obs_export_path, track_export_path)
+            VALUES (?, ?, ?, ?, ?, ?)''',
+            (date, counter, paths['obs_path'], paths['track_path'],
+             paths['obs_export_path'], paths['track_export_path']))
+
+    def find(self, date, counter) -> dict:
+        '''Returns the session with given date and counter or None'''
+        return self.query_one('SELECT * FROM sessions WHERE date = ? AND counter = ?', (date, counter))
+
+    def find_by_obs_path(self, obs_path) -> dict:
+        '''
+        - Returns the session owning an obs csv, registering it if its name
+        follows the obs naming scheme
+        - Returns None for files that don't belong to a session
+        '''
+        session = self.query_one('SELECT * FROM sessions WHERE obs_path = ?', (os.path.abspath(obs_path),))
+        if session:
+            return session
+
+        parsed = self.parse_obs_filename(os.path.basename(obs_path))
+        if not parsed:
+            return None
+        if os.path.dirname(os.path.abspath(obs_path)) == self.output_dir:
+            return self.register(*parsed)
+
+        # CSVs from other folders keep their location but aren't cataloged
+        date, counter = parsed
+        session = dict.fromkeys(self.COLUMNS)
+        session.update(self.session_paths(date, counter))
+        session.update({'date': date, 'counter': str(counter), 'obs_path': obs_path})
+        return session
+
+    def list_sessions(self) -> list[dict]:
+        '''Returns all sessions, most recently created first'''
+        with self.lock:
+            rows = self.conn.execute('SELECT * FROM sessions ORDER BY id DESC').fetchall()
+        return [self.to_dict(row) for row in rows]
+
+    def update_obs(self, obs_path, obs_rows, start_time, end_time):
+        '''Records an obs csv's row count and time range'''
+        with self.lock, self.conn:
+            self.conn.execute('''
+                UPDATE sessions SET obs_rows = ?, start_time = ?, end_time = ?
+                WHERE obs_path = ?''',
+                (obs_rows, start_time, end_time, os.path.abspath(obs_path)))
+
+    def add_track_rows(self, track_path, track_rows):
+        '''Adds newly written rows to a track csv's row count'''
+        with self.lock, self.conn:
+            self.conn.execute('UPDATE sessions SET track_rows = track_rows + ? WHERE track_path = ?',
+                              (track_rows, os.path.abspath(track_path)))
+
+    def scan(self):
+        '''Registers every obs csv in the output directory that follows the naming scheme'''
+        with self.lock, self.conn:
+            for filename in sorted(os.listdir(self.output_dir)):
+                parsed = self.parse_obs_filename(filename)
+                if parsed:
+                    self.insert(*parsed)
+
+    def query_one(self, sql, params) -> dict:
+        '''Runs a query and returns its first row as a dict or None'''
+        with self.lock:
+            row = self.conn.execute(sql, params).fetchone()
+        return self.to_dict(row) if row else None
+
+    def to_dict(self, row) -> dict:
+        '''Converts a sessions row to a dict with the counter as a string'''
+        session = {key: row[key] for key in self.COLUMNS}
+        session['counter'] = str(session['counter'])
+        return session
+
+    @staticmethod
+    def parse_obs_filename(filename):
+        '''
+        - Returns (date, counter) for obs csv names like 07Sep2024_obs.csv or
+        07Sep2024_obs_1.csv
+        - Returns None if filename is formatted incorrectly
+        '''
+        name, ext = os.path.splitext(filename)
+        if ext.lower() != '.csv':
+            return None
+
+        parts = name.split('_')
+        if len(parts) == 2:
+            if len(parts[0]) != 9 or parts[1] != 'obs':
+                return None
+            return parts[0], 0
+        elif len(parts) == 3:
+            if len(parts[0]) != 9 or parts[1] != 'obs' or not parts[2].isdigit():
+                return None
+            return parts[0], int(parts[2])
+        return None
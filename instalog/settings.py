@@ -0,0 +1,114 @@
+import asyncio
+import json
+import os
+
+# Every known setting: expected type, whether it is required, and extra checks
+SCHEMA = {
+    'baud_rate': {'type': int, 'required': True, 'min': 1},
+    'shortcuts': {'type': dict, 'required': True, 'values': str},
+    'storage': {'type': str, 'required': False, 'choices': ['csv', 'sqlite'], 'default': 'csv'},
+    'profile': {'type': bool, 'required': False, 'default': False},
+    'tile_dir': {'type': str, 'required': False, 'default': 'tiles'}
+}
+
+# Settings that are only read at startup
+RESTART_KEYS = ['baud_rate', 'storage', 'profile', 'tile_dir']
+
+class SettingsError(Exception):
+    '''Raised when the settings file can't be read or doesn't match the schema'''
+
+class Settings:
+    '''Validated settings compiled into the lookups the app uses'''
+    def __init__(self, data):
+        self.values = {key: data.get(key, rules.get('default')) for key, rules in SCHEMA.items()}
+        # Shortcuts are matched case-insensitively, so keys are stored uppercase
+        self.values['shortcuts'] = {key.strip().upper(): name for key, name in data['shortcuts'].items()}
+
+    def get(self, key, default=None):
+        '''Returns a setting's value'''
+        value = self.values.get(key)
+        return default if value is None else value
+
+    @property
+    def shortcuts(self):
+        return self.values['shortcuts']
+
+def validate(data) -> list[str]:
+    '''Returns a list of problems with the given settings (empty if valid)'''
+    if not isinstance(data, dict):
+        return ['Settings must be a JSON object']
+
+    errors = []
+    for key, rules in SCHEMA.items():
+        if key not in data:
+            if rules['required']:
+                errors.append(f'No {key} found in settings')
+            continue
+
+        value = data[key]
+        # bool is a subclass of int, so it's rejected explicitly for numbers
+        if not isinstance(value, rules['type']) or (rules['type'] is int and isinstance(value, bool)):
+            errors.append(f'{key} must be of type {rules["type"].__name__}')
+            continue
+        if 'min' in rules and value < rules['min']:
+            errors.append(f'{key} must be at least {rules["min"]}')
+        if 'choices' in rules and value not in rules['choices']:
+            errors.append(f'{key} must be one of: {", ".join(rules["choices"])}')
+        if 'values' in rules:
+            if not value:
+                errors.append(f'No {key} found in settings')
+            for item_key, item_value in value.items():
+                if not isinstance(item_value, rules['values']) or not item_key.strip():
+                    errors.append(f'{key} entry "{item_key}" is invalid')
+
+    for key in data:
+        if key not in SCHEMA:
+            errors.append(f'Unknown setting: {key}')
+    return errors
+
+def load_settings(filepath) -> Settings:
+    '''Reads, validates and compiles the settings file'''
+    try:
+        with open(filepath) as file:
+            data = json.load(file)
+    except Exception as e:
+        raise SettingsError(f'Error opening settings file: {e}')
+
+    errors = validate(data)
+    if errors:
+        raise SettingsError('\n'.join(errors))
+    return Settings(data)
+
+class SettingsWatcher:
+    '''Polls the settings file and reloads it whenever it changes'''
+    def __init__(self, filepath, on_reload, on_error, interval=1.0):
+        self.filepath = filepath
+        self.on_reload = on_reload # Called with the new Settings
+        self.on_error = on_error # Called with an error message
+        self.interval = interval
+        self.last_stat = self.stat()
+
+    def stat(self):
+        '''Returns (modification time, size) of the settings file or None'''
+        try:
+            stat = os.stat(self.filepath)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    async def watch(self):
+        '''Checks the settings file every interval seconds (runs on the io loop)'''
+        while True:
+            await asyncio.sleep(self.interval)
+            current_stat = self.stat()
+            if current_stat == self.last_stat:
+                continue
+            self.last_stat = current_stat
+
+            # The old settings stay active until the new file is fully valid
+            try:
+                settings = load_settings(self.filepath)
+            except SettingsError as e:
+                self.on_error(str(e))
+            else:
+                self.on_reload(settings)
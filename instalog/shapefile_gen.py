@@ -1,14 +1,35 @@
 import pandas as pd
-from shapely.geometry import Point, LineString
+import numpy as np
+import shapely
 import geopandas as gpd
 from datetime import datetime
+import shutil
 import os
 from .path_utils import new_path
+from .track_index import TrackIndex
+
+class ExportCancelled(Exception):
+    '''Raised when an export job is cancelled between steps'''
+
+class ExportJob:
+    '''Snapshot of everything needed to export one session'''
+    def __init__(self, obs_csv_path, track_csv_path, date, counter, summary=None):
+        self.obs_csv_path = obs_csv_path
+        self.track_csv_path = track_csv_path
+        self.date = date
+        self.counter = counter
+        self.summary = summary
+
+    def name(self):
+        '''Returns a short name for progress messages'''
+        return os.path.splitext(os.path.basename(self.obs_csv_path))[0]
 
 class ShapefileGenerator:
-    def __init__(self, output_dir, callback):
+    def __init__(self, output_dir, callback, chunk_size=50000, store_for=None):
         self.output_dir = output_dir
         self.callback = callback
+        self.store_for = store_for # Returns the SQLite store for a csv path when that backend is used
+        self.chunk_size = chunk_size # Number of track rows held in memory per chunk
 
         self.date = None
         self.counter = None
@@ -22,57 +43,173 @@ class ShapefileGenerator:
             self.date = data['date']
             self.counter = data['counter']
 
-    def generate(self):
-        '''Starts shapefile generation'''
+    def make_job(self):
+        '''
+        - Returns a snapshot of the current session for exporting
+        - Returns None if nothing has been saved yet
+        '''
         obs_csv_path = self.callback('get obs csv path')
         track_csv_path = self.callback('get track csv path')
 
-        # If nothing has been saved, csv_path will be "None", so terminate program
+        # If nothing has been saved, csv_path will be "None"
         if not obs_csv_path:
+            return None
+
+        summary = self.callback('get effort summary')
+        return ExportJob(obs_csv_path, track_csv_path, self.date, self.counter, summary)
+
+    def generate(self, job=None, progress=None, cancel_event=None):
+        '''
+        - Generates shapefiles for the given job (or the current session)
+        - Reports (steps done, total steps, message) to progress if given
+        - Raises ExportCancelled if cancel_event is set between steps or
+        track chunks
+        - Shapefiles are written to hidden staging folders and only moved into
+        place once every step has finished, so a cancelled or failed export
+        leaves the previous output untouched
+        '''
+        job = job or self.make_job()
+        if not job:
             return
-        
-        obs_df = pd.read_csv(obs_csv_path)
-        track_df = pd.read_csv(track_csv_path)
 
-        self.add_obs_geometry(obs_df)
-        self.add_track_geometry(track_df)
+        steps = ['exporting csvs', 'indexing track', 'writing track shapefile', 'writing obs shapefile']
+        def step(i):
+            self.check_cancelled(cancel_event)
+            if progress:
+                progress(i, len(steps), f'{job.name()}: {steps[i]}')
+
+        step(0)
+        # CSVs are produced from the store, then exported like any other session
+        if self.store_for:
+            store = self.store_for(job.obs_csv_path)
+            store.export_obs_csv(job.obs_csv_path)
+            store.export_track_csv(job.track_csv_path)
+
+        output_paths = [self.shapefile_path('track', job), self.shapefile_path('obs', job)]
+        track_path, obs_path = [self.staging_path(path) for path in output_paths]
+        try:
+            step(1)
+            track_index = TrackIndex.from_csv(job.track_csv_path, chunk_size=self.chunk_size)
+
+            step(2)
+            self.write_track_shapefile(job, track_path, track_index, cancel_event)
+            if job.summary:
+                self.write_summary(job.summary, track_path)
+
+            step(3)
+            obs_df = pd.read_csv(job.obs_csv_path)
+            self.add_obs_geometry(obs_df)
+            if track_index:
+                self.add_track_links(obs_df, track_index)
+            self.write_shapefile(obs_df, obs_path)
+            self.check_cancelled(cancel_event)
+        except Exception:
+            for path in (track_path, obs_path):
+                shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+            raise
+
+        for output_path in output_paths:
+            self.publish(output_path)
+        if progress:
+            progress(len(steps), len(steps), f'{job.name()}: done')
+
+    def check_cancelled(self, cancel_event):
+        '''Raises ExportCancelled if cancel_event is set'''
+        if cancel_event and cancel_event.is_set():
+            raise ExportCancelled()
+
+    def write_track_shapefile(self, job, output_path, track_index=None, cancel_event=None):
+        '''
+        - Streams the track csv into its shapefile one chunk at a time so memory
+        stays bounded regardless of track length
+        - Each chunk is held back until the next one is read since its last
+        segment ends at the next chunk's first point
+        - Rows get their segment ID, leg and cumulative distance if indexed
+        '''
+        pending = None
+        mode = 'w'
+        offset = 0
+        for chunk in pd.read_csv(job.track_csv_path, chunksize=self.chunk_size):
+            self.check_cancelled(cancel_event)
+            if pending is not None:
+                next_point = chunk[['Longitude', 'Latitude']].iloc[0].to_numpy(dtype=float)
+                self.add_track_geometry(pending, next_point)
+                self.add_track_attributes(pending, track_index, offset)
+                self.write_shapefile(pending, output_path, mode)
+                mode = 'a'
+                offset += len(pending)
+            pending = chunk
+
+        if pending is not None and len(pending):
+            self.add_track_geometry(pending)
+            self.add_track_attributes(pending, track_index, offset)
+            self.write_shapefile(pending, output_path, mode)
+
+    def summary_path(self, track_path):
+        '''Returns the path of the summary csv next to a track shapefile'''
+        return os.path.splitext(track_path)[0] + '_summary.csv'
 
-        self.write_shapefile('track', track_df)
-        self.write_shapefile('obs', obs_df)
+    def write_summary(self, summary, track_path):
+        '''Writes session summary attributes next to the track shapefile'''
+        pd.DataFrame([summary]).to_csv(self.summary_path(track_path), index=False)
+
+    def read_summary(self, track_path):
+        '''Returns the summary last written next to a track shapefile, or None if there is none'''
+        summary_path = self.summary_path(track_path)
+        if not os.path.exists(summary_path):
+            return None
+        try:
+            rows = pd.read_csv(summary_path, dtype=str, keep_default_na=False).to_dict('records')
+        except Exception:
+            return None
+        return rows[0] if rows else None
+
+    def add_track_attributes(self, df, track_index, offset):
+        '''Adds segment ID, leg and cumulative distance columns to a track chunk'''
+        if not track_index:
+            return
+        attributes = track_index.track_attributes(offset, offset + len(df))
+        for column in attributes.columns:
+            df[column] = attributes[column].to_numpy()
+
+    def add_track_links(self, df, track_index):
+        '''Adds segment ID, leg and along-track distance columns to the obs dataframe'''
+        links = track_index.locate(df)
+        for column in links.columns:
+            df[column] = links[column]
 
     def add_obs_geometry(self, df):
         '''Adds geometry column of "Point" objects to provided dataframe'''
-        points = []
-        for i in range(len(df)):
-            point = Point(df.iloc[i]['Longitude'], df.iloc[i]['Latitude'])
-            points.append(point)
-
-        df['Geometry'] = points
+        df['Geometry'] = gpd.points_from_xy(df['Longitude'], df['Latitude'])
     
-    def add_track_geometry(self, df):
-        '''Adds geometry column of "LineString" objects to provided dataframe'''
-        linestrings = []
-        for i in range(len(df) - 1):
-            start = (df.iloc[i]['Longitude'], df.iloc[i]['Latitude'])
-            end = (df.iloc[i + 1]['Longitude'], df.iloc[i + 1]['Latitude'])
-            ls = LineString([start, end])
-            linestrings.append(ls)
+    def add_track_geometry(self, df, next_point=None):
+        '''
+        - Adds geometry column of "LineString" objects to provided dataframe
+        - Each row's segment ends at the following row, or at next_point for
+        the last row when the track continues in another chunk
+        '''
+        coords = df[['Longitude', 'Latitude']].to_numpy(dtype=float)
+        if next_point is not None:
+            coords = np.vstack([coords, next_point])
+        # A single point becomes a zero-length segment
+        elif len(coords) == 1:
+            coords = np.vstack([coords, coords])
+
+        segments = np.stack([coords[:-1], coords[1:]], axis=1)
+        linestrings = shapely.linestrings(segments)
 
         # Add last element twice since entries can't be empty
-        if linestrings:
-            linestrings.append(linestrings[-1])
+        if len(linestrings) < len(df):
+            linestrings = np.concatenate([linestrings, linestrings[-1:]])
 
         df['Geometry'] = linestrings
 
-    def write_shapefile(self, type, df):
-        '''Writes shapefile of given type to output directory'''
-        gdf = gpd.GeoDataFrame(df, geometry='Geometry')
-        gdf.set_crs(epsg=4326, inplace=True)
-
-        if self.date:
-            dir_name = f'{self.date}_{type}' if self.counter == '0' else f'{self.date}_{type}_{self.counter}'
-            filename = dir_name + '.shp'
-            output_path = os.path.join(self.output_dir, dir_name, filename)
+    def shapefile_path(self, type, job):
+        '''Returns output path for shapefile of given type'''
+        if job.date:
+            dir_name = f'{job.date}_{type}' if job.counter == '0' else f'{job.date}_{type}_{job.counter}'
+            dir = os.path.join(self.output_dir, dir_name)
+            output_path = os.path.join(dir, dir_name + '.shp')
         else:
             date = datetime.today().strftime('%d%b%Y')
             name = f'{date}_{type}'
@@ -80,7 +217,29 @@ class ShapefileGenerator:
             if os.path.exists(dir):
                 dir = new_path(dir)
             output_path = os.path.join(dir, name + '.shp')
+        return output_path
+
+    def staging_dir(self, output_path):
+        '''Returns the hidden directory a shapefile is written to before it is published'''
+        dir = os.path.dirname(output_path)
+        return os.path.join(os.path.dirname(dir), f'.{os.path.basename(dir)}.partial')
 
-            os.makedirs(dir, exist_ok=True) # Need to make directory before writing
+    def staging_path(self, output_path):
+        '''Returns the staging path for a shapefile, starting from an empty staging directory'''
+        staging_dir = self.staging_dir(output_path)
+        shutil.rmtree(staging_dir, ignore_errors=True) # Left over from an interrupted export
+        os.makedirs(staging_dir)
+        return os.path.join(staging_dir, os.path.basename(output_path))
 
-        gdf.to_file(output_path)
\ No newline at end of file
+    def publish(self, output_path):
+        '''Moves a finished shapefile's staging directory into place, replacing any previous output'''
+        dir = os.path.dirname(output_path)
+        if os.path.exists(dir):
+            shutil.rmtree(dir)
+        os.replace(self.staging_dir(output_path), dir)
+
+    def write_shapefile(self, df, output_path, mode='w'):
+        '''Writes (or appends) dataframe to shapefile at output_path'''
+        gdf = gpd.GeoDataFrame(df, geometry='Geometry')
+        gdf.set_crs(epsg=4326, inplace=True)
+        gdf.to_file(output_path, mode=mode)
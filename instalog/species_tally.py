@@ -0,0 +1,44 @@
+class SpeciesTally:
+    '''Running per-species totals that are updated one row at a time'''
+    def __init__(self):
+        # species -> [number of sightings, total count]
+        self.totals = {}
+
+    def reset(self):
+        '''Clears all totals'''
+        self.totals.clear()
+
+    def add(self, row) -> str:
+        '''Adds a treeview row to the totals and returns its species'''
+        species, count = self.parse_row(row)
+        totals = self.totals.setdefault(species, [0, 0])
+        totals[0] += 1
+        totals[1] += count
+        return species
+
+    def remove(self, row) -> str:
+        '''Removes a treeview row from the totals and returns its species'''
+        species, count = self.parse_row(row)
+        totals = self.totals.get(species)
+        if totals:
+            totals[0] -= 1
+            totals[1] -= count
+            # Drop species once its last sighting is gone
+            if totals[0] <= 0:
+                del self.totals[species]
+        return species
+
+    def get(self, species) -> tuple[int]:
+        '''Returns (sightings, total count) for a species or None if absent'''
+        totals = self.totals.get(species)
+        return tuple(totals) if totals else None
+
+    def parse_row(self, row) -> tuple:
+        '''Returns species and count from a treeview row'''
+        species = str(row[0])
+        # Counts can be edited by hand, so anything non-numeric counts as 0
+        try:
+            count = int(row[1])
+        except (ValueError, TypeError):
+            count = 0
+        return species, count
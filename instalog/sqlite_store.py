@@ -0,0 +1,188 @@
+import sqlite3
+import threading
+import csv
+import os
+
+OBS_COLUMNS = ['Species', 'Count', 'Time', 'Obs', 'Comment', 'Latitude', 'Longitude']
+TRACK_COLUMNS = ['Time', 'Latitude', 'Longitude']
+
+class SqliteStore:
+    '''
+    - Transactional storage for one session's observations and track fixes
+    - Uses WAL mode so exports can read while the GPS keeps inserting
+    - Obs and track CSVs are produced from it as exports
+    - The size and modification time of each CSV it writes are recorded, so a
+    CSV changed since (e.g. by continuing the session in CSV mode) is imported
+    again when the store is opened
+    '''
+    def __init__(self, db_path, obs_csv_path=None, track_csv_path=None):
+        self.db_path = db_path
+
+        # Used from the io loop and its executor, so access is serialized by a lock
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=FULL') # Commits survive power loss
+            with self.conn:
+                self.conn.execute(f'''
+                    CREATE TABLE IF NOT EXISTS obs (
+                        seq INTEGER PRIMARY KEY,
+                        {', '.join(f'"{column}"' for column in OBS_COLUMNS)}
+                    )''')
+                self.conn.execute('CREATE INDEX IF NOT EXISTS obs_time ON obs ("Time")')
+                self.conn.execute(f'''
+                    CREATE TABLE IF NOT EXISTS fixes (
+                        seq INTEGER PRIMARY KEY,
+                        {', '.join(f'"{column}"' for column in TRACK_COLUMNS)}
+                    )''')
+                self.conn.execute('CREATE INDEX IF NOT EXISTS fixes_time ON fixes ("Time")')
+                self.conn.execute('''
+                    CREATE TABLE IF NOT EXISTS csv_stats (
+                        "table" TEXT PRIMARY KEY,
+                        mtime_ns INTEGER,
+                        size INTEGER
+                    )''')
+
+        # Exports stream through their own connection, so with WAL they read a
+        # consistent snapshot without holding up the GPS and obs writes
+        self.read_conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.read_lock = threading.Lock()
+
+        # Rows logged in CSV mode are carried over so exports don't lose them
+        self.import_csvs(obs_csv_path, track_csv_path)
+
+    @staticmethod
+    def path_for(csv_path):
+        '''Returns the database path of the session an obs or track csv belongs to'''
+        directory, filename = os.path.split(csv_path)
+        name = os.path.splitext(filename)[0]
+        for type in ('_obs', '_track'):
+            name = name.replace(type, '_session', 1)
+        return os.path.join(directory, name + '.sqlite')
+
+    def close(self):
+        '''Closes the database'''
+        with self.read_lock:
+            self.read_conn.close()
+        with self.lock:
+            self.conn.close()
+
+    def replace_obs(self, rows):
+        '''Replaces all observations in one transaction'''
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM obs')
+            self.conn.executemany(f'INSERT INTO obs ({self.column_list(OBS_COLUMNS)}) VALUES ({self.placeholders(OBS_COLUMNS)})',
+                                  rows)
+
+    def insert_fixes(self, rows):
+        '''Inserts a batch of track fixes in one transaction'''
+        with self.lock, self.conn:
+            self.conn.executemany(f'INSERT INTO fixes ({self.column_list(TRACK_COLUMNS)}) VALUES ({self.placeholders(TRACK_COLUMNS)})',
+                                  rows)
+
+    def export_obs_csv(self, path):
+        '''Writes all observations to an obs csv'''
+        self.export_csv('obs', OBS_COLUMNS, path)
+
+    def export_track_csv(self, path):
+        '''Writes all fixes to a track csv'''
+        self.export_csv('fixes', TRACK_COLUMNS, path)
+
+    def export_csv(self, table, columns, path, batch_size=10000):
+        '''Streams a table to a csv through a temp file that is renamed over path'''
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(columns)
+            # One read transaction, so the csv is a single consistent snapshot
+            with self.read_lock:
+                self.read_conn.execute('BEGIN')
+                try:
+                    cursor = self.read_conn.execute(f'SELECT {self.column_list(columns)} FROM {table} ORDER BY seq')
+                    while True:
+                        rows = cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        writer.writerows(rows)
+                finally:
+                    self.read_conn.rollback()
+        with self.lock, self.conn:
+            os.replace(temp_path, path)
+            self.record_csv_stat(table, path)
+
+    def import_csvs(self, obs_csv_path, track_csv_path):
+        '''
+        - Replaces a table with its csv if the csv was changed outside this
+        store since it was last written or imported
+        - CSVs the store wrote itself are left alone since the store may have
+        newer rows
+        '''
+        for table, columns, path in (('obs', OBS_COLUMNS, obs_csv_path), ('fixes', TRACK_COLUMNS, track_csv_path)):
+            if not path or not os.path.exists(path):
+                continue
+            with self.lock:
+                row = self.conn.execute('SELECT mtime_ns, size FROM csv_stats WHERE "table" = ?', (table,)).fetchone()
+                num_rows = self.conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            if row == self.csv_stat(path):
+                continue
+            # Stores from before CSV states were recorded only give way to a longer csv
+            if row is None and num_rows and self.count_csv_rows(path) <= num_rows:
+                continue
+
+            with open(path, newline='') as file:
+                reader = csv.reader(file)
+                next(reader, None) # Skip headers
+                with self.lock, self.conn:
+                    self.conn.execute(f'DELETE FROM {table}')
+                    self.conn.executemany(f'INSERT INTO {table} ({self.column_list(columns)}) VALUES ({self.placeholders(columns)})',
+                                          reader)
+                    self.record_csv_stat(table, path)
+
+    def count_csv_rows(self, path):
+        '''Returns the number of data rows in a csv'''
+        with open(path, newline='') as file:
+            return max(sum(1 for _ in csv.reader(file)) - 1, 0)
+
+    def csv_stat(self, path):
+        '''Returns (modification time, size) of a csv'''
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def record_csv_stat(self, table, path):
+        '''Records the state of a table's csv as in sync with the store (within a transaction)'''
+        self.conn.execute('INSERT OR REPLACE INTO csv_stats ("table", mtime_ns, size) VALUES (?, ?, ?)',
+                          (table, *self.csv_stat(path)))
+
+    def column_list(self, columns):
+        '''Returns quoted column names for SQL'''
+        return ', '.join(f'"{column}"' for column in columns)
+
+    def placeholders(self, columns):
+        '''Returns parameter placeholders for SQL'''
+        return ', '.join('?' for _ in columns)
+
+class SqliteStores:
+    '''Opens each session's store once and hands it out by obs or track csv path'''
+    def __init__(self):
+        self.stores = {}
+        self.lock = threading.Lock()
+
+    def get(self, csv_path) -> SqliteStore:
+        '''Returns the store of the session a csv belongs to'''
+        db_path = SqliteStore.path_for(csv_path)
+        with self.lock:
+            if db_path not in self.stores:
+                directory, filename = os.path.split(db_path)
+                name = os.path.splitext(filename)[0]
+                obs_csv_path = os.path.join(directory, name.replace('_session', '_obs', 1) + '.csv')
+                track_csv_path = os.path.join(directory, name.replace('_session', '_track', 1) + '.csv')
+                self.stores[db_path] = SqliteStore(db_path, obs_csv_path, track_csv_path)
+            return self.stores[db_path]
+
+    def close(self):
+        '''Closes every open store'''
+        with self.lock:
+            for store in self.stores.values():
+                store.close()
+            self.stores.clear()
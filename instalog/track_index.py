@@ -0,0 +1,136 @@
+import pandas as pd
+import numpy as np
+import shapely
+from .geo_utils import haversine_np
+
+def parse_times(times) -> np.ndarray:
+    '''Converts a column of time strings to seconds (NaN where unreadable)'''
+    parsed = pd.to_datetime(pd.Series(times, dtype=str), errors='coerce', format='mixed')
+    return ((parsed - pd.Timestamp(0)).dt.total_seconds()).to_numpy(dtype=float)
+
+class TrackIndex:
+    '''
+    - Temporal (sorted fix times) and spatial index over track segments, kept
+    as a few flat numpy arrays so memory stays small on multi-day tracks
+    - Segment i runs from fix i to fix i + 1, matching row i of the track shapefile
+    - A new leg starts whenever the gap between two fixes exceeds leg_gap seconds.
+    Rows are written every few seconds even without a fix, so in practice a leg
+    is a stretch of uninterrupted GPS reading (usually one app run)
+    - Rows without a position yet (0, 0) or with unreadable coordinates give
+    their segments zero length and are left out of nearest-segment searches
+    - Segment geometries are only built for the segments being looked up, or one
+    chunk of chunk_size segments at a time for nearest-segment searches
+    '''
+    def __init__(self, times, lats, lons, leg_gap=60, chunk_size=50000):
+        self.times = times
+        self.lats = lats
+        self.lons = lons
+        self.chunk_size = chunk_size
+
+        invalid = np.isnan(lats) | np.isnan(lons) | ((lats == 0) & (lons == 0))
+        # A single fix becomes a zero-length segment
+        if len(times) > 1:
+            self.invalid_segments = invalid[:-1] | invalid[1:]
+            self.seg_lengths = np.where(self.invalid_segments, 0.0,
+                                        haversine_np(lats[:-1], lons[:-1], lats[1:], lons[1:]))
+        else:
+            self.invalid_segments = invalid
+            self.seg_lengths = np.zeros(1)
+        self.cum_dists = np.concatenate([[0.0], np.cumsum(self.seg_lengths)])
+
+        gaps = np.diff(times)
+        # Temporal lookups need sorted times (unreadable or wrapped times break this)
+        self.times_sorted = not np.isnan(times).any() and bool(np.all(gaps >= 0))
+        new_leg = ~(np.abs(gaps) <= leg_gap) # Unreadable times also start a new leg
+        self.fix_legs = np.concatenate([[1], 1 + np.cumsum(new_leg)]).astype(int)
+
+    @classmethod
+    def from_csv(cls, track_csv_path, leg_gap=60, chunk_size=50000):
+        '''Builds an index from the time and coordinate columns of a track csv, read in chunks'''
+        times, lats, lons = [], [], []
+        for chunk in pd.read_csv(track_csv_path, usecols=['Time', 'Latitude', 'Longitude'], chunksize=chunk_size):
+            times.append(parse_times(chunk['Time']))
+            lats.append(chunk['Latitude'].to_numpy(dtype=float))
+            lons.append(chunk['Longitude'].to_numpy(dtype=float))
+        if not times or not sum(len(chunk_times) for chunk_times in times):
+            return None
+        return cls(np.concatenate(times), np.concatenate(lats), np.concatenate(lons), leg_gap, chunk_size)
+
+    def num_segments(self):
+        '''Returns number of segments in the index'''
+        return len(self.seg_lengths)
+
+    def segments(self, seg_ids) -> np.ndarray:
+        '''Builds LineStrings for the given segment IDs'''
+        end = np.minimum(seg_ids + 1, len(self.times) - 1)
+        coords = np.stack([np.stack([self.lons[seg_ids], self.lats[seg_ids]], axis=1),
+                           np.stack([self.lons[end], self.lats[end]], axis=1)], axis=1)
+        return shapely.linestrings(coords)
+
+    def track_attributes(self, start, stop):
+        '''Returns segment ID, leg and cumulative distance for track rows [start, stop)'''
+        rows = np.arange(start, stop)
+        seg_ids = np.minimum(rows, self.num_segments() - 1)
+        return pd.DataFrame({
+            'SegID': seg_ids,
+            'Leg': self.fix_legs[seg_ids],
+            'CumDistM': self.cum_dists[np.minimum(rows, len(self.cum_dists) - 1)].round(1)
+        })
+
+    def nearest_segments(self, points) -> np.ndarray:
+        '''
+        - Returns the nearest valid segment ID for each point, searching one
+        chunk of segments at a time
+        - Points get segment 0 if the track has no valid segments
+        '''
+        best_ids = np.zeros(len(points), dtype=int)
+        best_dists = np.full(len(points), np.inf)
+        for start in range(0, self.num_segments(), self.chunk_size):
+            seg_ids = np.arange(start, min(start + self.chunk_size, self.num_segments()))
+            seg_ids = seg_ids[~self.invalid_segments[seg_ids]]
+            if not len(seg_ids):
+                continue
+            tree = shapely.STRtree(self.segments(seg_ids))
+            (input_idx, tree_idx), dists = tree.query_nearest(points, return_distance=True)
+            # Keep the first match when a point is equally close to several segments
+            _, first = np.unique(input_idx, return_index=True)
+            input_idx, tree_idx, dists = input_idx[first], tree_idx[first], dists[first]
+
+            closer = dists < best_dists[input_idx]
+            best_ids[input_idx[closer]] = seg_ids[tree_idx[closer]]
+            best_dists[input_idx[closer]] = dists[closer]
+        return best_ids
+
+    def locate(self, obs_df) -> pd.DataFrame:
+        '''
+        - Links every observation to a track segment in bulk
+        - Sightings whose time falls within the track use the segment flown at
+        that time, the rest use the nearest segment
+        - Returns segment ID, leg and along-track distance for each observation
+        '''
+        points = shapely.points(obs_df['Longitude'].to_numpy(dtype=float),
+                                obs_df['Latitude'].to_numpy(dtype=float))
+        obs_times = parse_times(obs_df['Time'])
+
+        # Temporal lookup of the segment that was being flown
+        seg_ids = np.searchsorted(self.times, obs_times, side='right') - 1
+        seg_ids = np.clip(seg_ids, 0, self.num_segments() - 1)
+        if self.times_sorted:
+            in_track = (obs_times >= self.times[0]) & (obs_times <= self.times[-1])
+        else:
+            in_track = np.zeros(len(obs_df), dtype=bool)
+
+        # Spatial lookup for everything else
+        missing = np.flatnonzero(~in_track)
+        if len(missing):
+            seg_ids[missing] = self.nearest_segments(points[missing])
+
+        fractions = shapely.line_locate_point(self.segments(seg_ids), points, normalized=True)
+        fractions = np.nan_to_num(fractions) # Zero-length segments give NaN
+        along = self.cum_dists[seg_ids] + fractions * self.seg_lengths[seg_ids]
+
+        return pd.DataFrame({
+            'SegID': seg_ids,
+            'Leg': self.fix_legs[seg_ids],
+            'AlongDistM': along.round(1)
+        }, index=obs_df.index)
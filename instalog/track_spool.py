@@ -0,0 +1,102 @@
+import tempfile
+import shutil
+import glob
+import csv
+import os
+
+SPOOL_PREFIX = '.track_spool_'
+
+class TrackSpool:
+    '''
+    - Holds track rows that have not been written to a track csv yet
+    - Keeps at most max_rows in memory and spills the rest to a temporary
+    spool file in the output directory
+    - Spool files left behind by a run that crashed are removed at startup
+    '''
+    def __init__(self, output_dir, max_rows=500):
+        self.output_dir = output_dir
+        self.max_rows = max_rows
+
+        self.rows = []
+        self.spool_path = None
+        self.num_spilled = 0
+        self.remove_stale()
+
+    def remove_stale(self):
+        '''Deletes spool files of earlier runs in the output directory'''
+        for path in glob.glob(os.path.join(glob.escape(self.output_dir), SPOOL_PREFIX + '*.csv')):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def __len__(self):
+        return len(self.rows)
+
+    def append(self, row):
+        '''Adds a row, spilling the in-memory window to disk once it is full'''
+        self.rows.append(row)
+        if len(self.rows) >= self.max_rows:
+            self.spill()
+
+    def spill(self):
+        '''Appends the in-memory rows to the spool file'''
+        if not self.spool_path:
+            fd, self.spool_path = tempfile.mkstemp(prefix=SPOOL_PREFIX, suffix='.csv', dir=self.output_dir)
+            os.close(fd)
+
+        with open(self.spool_path, mode='a', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerows(self.rows)
+        self.num_spilled += len(self.rows)
+        self.rows.clear()
+
+    def drain_to(self, path) -> int:
+        '''
+        - Appends spooled rows, then in-memory rows, to path and empties the spool
+        - Returns number of rows written
+        '''
+        num_rows = self.num_spilled + len(self.rows)
+        with open(path, mode='a', newline='') as file:
+            if self.spool_path:
+                with open(self.spool_path, newline='') as spool:
+                    shutil.copyfileobj(spool, file)
+            writer = csv.writer(file)
+            writer.writerows(self.rows)
+
+        self.discard()
+        return num_rows
+
+    def drain_batches(self, write_batch) -> int:
+        '''
+        - Passes spooled rows, then in-memory rows, to write_batch in batches of
+        at most max_rows so a long spilled transit is never loaded at once
+        - Empties the spool and returns number of rows written
+        '''
+        num_rows = self.num_spilled + len(self.rows)
+        if self.spool_path:
+            with open(self.spool_path, newline='') as spool:
+                batch = []
+                for row in csv.reader(spool):
+                    batch.append(row)
+                    if len(batch) >= self.max_rows:
+                        write_batch(batch)
+                        batch = []
+                if batch:
+                    write_batch(batch)
+        if self.rows:
+            write_batch(self.rows)
+
+        self.discard()
+        return num_rows
+
+    def discard(self):
+        '''Drops all rows and deletes the spool file'''
+        self.rows.clear()
+        self.num_spilled = 0
+        if self.spool_path:
+            try:
+                os.remove(self.spool_path)
+            except OSError:
+                pass
+            self.spool_path = None